@@ -2,3 +2,16 @@ export LOG_LEVEL=INFO
 export MAX_POLL_TIME=10
 export POLL_INTERVAL=0.5
 export MAX_UPDATE_ATTEMPTS=3
+export GAME_STORE=dynamodb
+export SNAPSHOT_INTERVAL=10
+export STORAGE_FORMAT=dict
+export GAME_CACHE_SIZE=128
+export GAME_CACHE_TTL=60
+export RETRY_BASE_DELAY=0.02
+export RETRY_MAX_DELAY=0.5
+export NOTIFIER=none
+export NOTIFY_ADDRESS=localhost:7878
+export PUSHER=none
+export CONNECTION_STORE=dynamodb
+export PUSH_ADDRESS=localhost:7879
+export PATCH_HISTORY_SIZE=16
@@ -1,14 +1,22 @@
 import logging
-import os
 
-from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
 from pydantic.error_wrappers import ValidationError
 
+import rsplog
+import rsppush
+import rspretry
 import rsputil
 import rspmodel
+from rspstate import GameState
 
 import handlers
 
+logger = logging.getLogger(__name__)
+
+# response header with the number of attempts needed to store the game
+ATTEMPTS_HEADER = 'X-Update-Attempts'
+
 def lambda_handler(event, context):
     
     rsputil.configure_logger()
@@ -21,43 +29,113 @@ def lambda_handler(event, context):
     try:
         request = rspmodel.ActionRequest(**body)
     except ValidationError as e:
-        print(e)
-        print("\n\n\n\n\n\n\n")
+        logger.info('illegal request: %s', e)
         return rsputil.api_client_error(f'Illegal request: {e}')
 
 
-    attempts_remaining = int(os.environ['MAX_UPDATE_ATTEMPTS'])
-    while attempts_remaining > 0:
-        attempts_remaining -= 1
-        
-        game = rsputil.get_game(request.gameId)
-        if game is None:
-            return rsputil.api_client_error('Game not found')
-
-        player = rsputil.get_player(game, request.user)
-        if player is None:
-            return rsputil.api_client_error('Player not in game')
+    # updates that lose a version race or are throttled are retried with
+    # backoff, while the lambda has time left
+    policy = rspretry.RetryPolicy.from_env(context)
+    attempts = 0
+    throttled = False
+    game = None
+    for attempts in policy.attempts():
+        try:
+            response = attempt_action(request, game)
+        except rsputil.ConditionalCheckFailedException as e:
+            # the action is applied again to the game that won the race, if
+            # the store returned it, rather than to a new read of the game
+            game = e.game
+            throttled = False
+            logger.info('version conflict', extra=rsplog.fields(gameId = request.gameId, attempt = attempts))
+            continue
+        except ClientError as e:
+            if not rspretry.is_throttling(e):
+                raise
+            game = None
+            throttled = True
+            logger.info('throttled', extra=rsplog.fields(gameId = request.gameId, attempt = attempts))
+            continue
 
-        if request.action.name not in game.actions[player]:
-            return rsputil.api_client_error('Action not allowed')
+        response.setdefault('headers', {})[ATTEMPTS_HEADER] = str(attempts)
+        return response
 
-        version = game.version
-        game.result = []
-        game.actions = {'home': ['POLL'], 'away': ['POLL']}
+    headers = {ATTEMPTS_HEADER: str(attempts)}
+    if throttled:
+        return rsputil.api_response(503, 'Game store is busy, try again', headers)
+    return rsputil.api_response(409, 'Game was updated concurrently, try again', headers)
 
-        try:
-            process_action(game, player, request.action)
-        except handlers.IllegalActionException as e:
-            return rsputil.api_client_error(f"Illegal action: {e}")
+# Process the action on the stored game, and store the result
+# game is the current stored game, if it is already known, otherwise it is read
+# Return the api response
+# raise ConditionalCheckFailedException if the game was updated concurrently
+def attempt_action(request, game=None):
+    if game is None:
+        game = rsputil.get_game(request.gameId)
+    if game is None:
+        return rsputil.api_client_error('Game not found')
+
+    player = rsputil.get_player(game, request.user)
+    if player is None:
+        return rsputil.api_client_error('Player not in game')
+
+    if request.action.name not in game.actions[player]:
+        return rsputil.api_client_error('Action not allowed')
+
+    version = game.version
+    state_before = game.state
+    # the game the client holds is kept, before the state takes over its
+    # fields, so that the response can be a patch from it
+    if request.patch and request.version == version and rsputil.GAME_HISTORY.get(game.gameId, version) is None:
+        rsputil.GAME_HISTORY.put(game.dict())
+    state = GameState.from_game(game)
+    state.result = []
+    state.actions = {'home': ['POLL'], 'away': ['POLL']}
 
-        try:
-            game.version = version + 1
-            rsputil.store_game(game, condition=Attr('version').eq(version))
-            return rsputil.api_success(game.dict())
-        except rsputil.ConditionalCheckFailedException:
-            continue
-        
-    return rsputil.api_server_fault("Failed to update game")
+    try:
+        process_action(state, player, request.action)
+    except handlers.IllegalActionException as e:
+        return rsputil.api_client_error(f"Illegal action: {e}")
+
+    state.version = version + 1
+    log_results(state)
+    game = state.to_game(game)
+
+    # the first RSP of an exchange only fills the player's slot, so it is
+    # stored without a version condition, and only the second RSP of the
+    # exchange, that resolves it, has to win a version race
+    # a game that is not marked clean was read from an item that can not be
+    # updated by path, such as a binary item read by a dict format store, so
+    # it is rewritten by a versioned store instead
+    if is_first_rsp(game, player, request.action) and game.is_marked_clean() and rsputil.supports_submit_rsp():
+        game, body = rsputil.submit_rsp(game, player, request.action, state_before)
+    else:
+        body = rsputil.store_game(game, expected_version=version, player=player, action=request.action)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info('stored game', extra=rsplog.fields(
+            gameId = game.gameId,
+            version = game.version,
+            cache = rsputil.GAME_CACHE.stats()))
+    rsppush.broadcast(game.gameId, body)
+    if request.patch:
+        body = rsputil.get_patch_body(game.gameId, request.version, game.version, body)
+    return rsputil.api_json_success(body)
+
+# add the results of the handled action to the result log of the GameState,
+# and drop the entries older than RESULT_LOG_VERSIONS versions
+# the log is left as it is when there are no results, so that a first RSP
+# only changes the fields that submit_rsp stores
+def log_results(state: GameState):
+    if not state.result:
+        return
+
+    oldest = state.version - rspmodel.RESULT_LOG_VERSIONS
+    state.resultLog = [entry for entry in state.resultLog if entry.version > oldest] + [
+        rspmodel.ResultLogEntry.construct(version = state.version, result = list(state.result))]
+
+# return True if the handled action was an RSP that is waiting for the opponent's RSP
+def is_first_rsp(game, player, action):
+    return isinstance(action, rspmodel.RspAction) and game.rsp[player] is not None
 
 
 ACTION_HANDLERS = [
@@ -97,16 +175,50 @@ ACTION_HANDLERS = [
     handlers.FumbleActionHandler()
 ]
 
-# mutate the game in place
-# raise IllegalActionException if the action is illegal
-def process_action(game, player, action):
-    for handler in ACTION_HANDLERS:
-        if (game.state in handler.states) and (type(action) in handler.actions):
-            logging.debug(f'init game: {game}')
-            logging.info(f'selected handler: {type(handler).__name__}')
-            handler.handle_action(game, player, action)
-            logging.debug(f'handled game: {game}')
-            return
-    
-    raise Exception(f"No handler found for action {type(action)} in state {game.state}")
+# States in which no action can be taken
+TERMINAL_STATES = [rspmodel.State.GAME_OVER]
+
+# Return a dict mapping each (state, action type) to the handler for it
+# raise an exception if two handlers claim the same (state, action type), or
+# if a non terminal state has no handler
+def build_dispatch_table(action_handlers):
+    dispatch_table = {}
 
+    for handler in action_handlers:
+        for state in handler.states:
+            for action_type in handler.actions:
+                key = (state, action_type)
+                if key in dispatch_table:
+                    raise Exception(f'Handlers {type(dispatch_table[key]).__name__} and {type(handler).__name__} '
+                        f'both handle {action_type.__name__} in state {state}')
+                dispatch_table[key] = handler
+
+    handled_states = {state for state, _ in dispatch_table}
+    unhandled_states = [state for state in rspmodel.State if state not in handled_states and state not in TERMINAL_STATES]
+    if unhandled_states:
+        raise Exception(f'No handler for states: {unhandled_states}')
+
+    return dispatch_table
+
+DISPATCH_TABLE = build_dispatch_table(ACTION_HANDLERS)
+
+# mutate the GameState in place
+# raise IllegalActionException if the action is illegal
+def process_action(game: GameState, player, action):
+    handler = DISPATCH_TABLE.get((game.state, type(action)))
+    if handler is None:
+        raise Exception(f"No handler found for action {type(action)} in state {game.state}")
+
+    logger.debug('init game: %s', game)
+    state = game.state
+
+    handler.handle_action(game, player, action)
+
+    logger.debug('handled game: %s', game)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info('handled action', extra=rsplog.fields(
+            gameId = game.gameId,
+            version = game.version,
+            stateBefore = state,
+            stateAfter = game.state,
+            handler = type(handler).__name__))
@@ -2,14 +2,22 @@ import logging
 import random
 
 import rspmodel
+import statemachine
 from rspmodel import BlockedKickResult, CoffinCornerResult, FakeKickChoice, FakeKickChoiceAction, FakeKickResult, GainResult, IncompletePassResult, KickoffChoice, KickoffElectionChoice, KickoffElectionResult, OutOfBoundsKickResult, OutOfBoundsPassResult, PatChoice, Play, RollAgainChoice, RollResult, RspChoice, SackChoice, ScoreResult, State, TouchbackChoice, TurnoverResult, TurnoverType
 from rsputil import get_opponent
+from statemachine import ACTOR, BOTH, DEFENSE, LOSS, OFFENSE, OPPONENT, TIE, WIN, Rule, effect
+
+logger = logging.getLogger(__name__)
 
 class IllegalActionException(Exception):
     pass
 
 GAME_LENGTH = 80
 
+# the outcome of a pick roll that does not intercept the pass, the outcome of
+# one that does is the play
+NO_PICK = 'NO_PICK'
+
 def set_call_play_state(game):
     game.state = State.PLAY_CALL
     game.actions[game.possession] = ['CALL_PLAY', 'PENALTY']
@@ -24,6 +32,7 @@ def set_kickoff_state(game, yardline):
     game.actions[game.possession] = ['KICKOFF_CHOICE']
 
 
+@effect(State.PAT_CHOICE)
 def touchdown(game):
     game.score[game.possession] += 6
     game.state = State.PAT_CHOICE
@@ -32,6 +41,7 @@ def touchdown(game):
     game.result += [ScoreResult(type = 'TOUCHDOWN')]
 
 
+@effect(State.GAME_OVER, State.KICKOFF_CHOICE)
 def safety(game):
     game.score[get_opponent(game.possession)] += 2
     game.result += [rspmodel.ScoreResult(type = 'SAFETY')]
@@ -45,6 +55,7 @@ def safety(game):
         set_kickoff_state(game, 20)
 
 
+@effect(touchdown, safety, State.GAME_OVER, State.PLAY_CALL)
 def end_play(game):
 
     game.play = None
@@ -92,6 +103,11 @@ def switch_possession(game):
 def roll_dice(count):
     return [random.randint(1, 6) for _ in range(count)]
 
+@effect(State.PLAY_CALL)
+def start_drive(game):
+    set_call_play_state(game)
+    set_first_down(game)
+
 class ActionHandler:
 
     # A list of states that the game can be in for this
@@ -109,6 +125,23 @@ class ActionHandler:
     def handle_action(game, player, action):
         raise NotImplementedError()
 
+# Apply the rule for the given outcome in the current state of the game
+# If there is no rule, IllegalActionException will be raised
+def apply_rule(game, player, outcome):
+    rule = RULE_TABLE.get((game.state, outcome))
+    if rule is None:
+        raise IllegalActionException(f'Unexpected {outcome} in state {game.state}')
+    statemachine.apply_rule(game, player, rule)
+
+class ChoiceActionHandler(ActionHandler):
+    # Handle an action whose outcome is given by a single field of the action
+    # the transition for each value of the field is declared in RULES
+    # subclasses should override the states and actions class members
+    choice_field = 'choice'
+
+    def handle_action(self, game, player, action):
+        apply_rule(game, player, getattr(action, self.choice_field))
+
 
 class RspActionHandler(ActionHandler):
     # Handle an action that requires an RSP completion
@@ -117,8 +150,9 @@ class RspActionHandler(ActionHandler):
     # other types of actions other than RspAction, it should not subclass RspActionHandler
     actions = [rspmodel.RspAction]
 
+    # by default, the transition for the outcome is declared in RULES
     def handle_rsp_action(self, game, winner):
-        raise NotImplementedError()
+        apply_rule(game, winner, statemachine.get_rsp_outcome(game, winner))
 
     def handle_action(self, game, player, action):
         game.rsp[player] = action.choice
@@ -131,7 +165,7 @@ class RspActionHandler(ActionHandler):
                 away = game.rsp['away']
             )]
             winner = self.get_rsp_winner(game.rsp)
-            logging.info(f'RSP winner: {winner}')
+            logger.debug('RSP winner: %s', winner)
             game.rsp = {
                 'home': None,
                 'away': None,
@@ -157,21 +191,18 @@ class RspActionHandler(ActionHandler):
 class CoinTossActionHandler(RspActionHandler):
     states = [State.COIN_TOSS]
 
+    # no team has possession before the coin toss, so the winner of the RSP
+    # wins the toss
     def handle_rsp_action(self, game, winner):
-        # during the cointoss a tie is a redo
-        if winner is None:
-            game.actions['home'] = ['RSP']
-            game.actions['away'] = ['RSP']
-        else:
-            game.state = State.KICKOFF_ELECTION
-            game.actions[winner] = ['KICKOFF_ELECTION']
-            game.actions[get_opponent(winner)] = ['POLL']
+        apply_rule(game, winner, TIE if winner is None else WIN)
 
 
 class RollActionHandler(ActionHandler):
     # Handle an action that requires a roll action
-    # subclasses should override the "allowed_counts" class member,
-    # the states class member, and implement handle_roll_action
+    # the transition for the outcome of the roll is declared in RULES
+    # subclasses should override the "allowed_counts" class member and
+    # the states class member, and can override handle_roll_action, to move
+    # the ball before the rule is applied
     # subclasses should *not* override actions. If a handler wants to accept
     # other types of actions other than RollAction, it should not subclass RollActionHandler
     actions = [rspmodel.RollAction]
@@ -180,7 +211,11 @@ class RollActionHandler(ActionHandler):
     allowed_counts = None
 
     def handle_roll_action(self, game, roll):
-        raise NotImplementedError()
+        pass
+
+    # by default, the outcome of a roll is the sum of its dice
+    def get_roll_outcome(self, game, roll):
+        return sum(roll)
 
     def handle_action(self, game, player, action):
         if action.count not in self.allowed_counts:
@@ -190,6 +225,36 @@ class RollActionHandler(ActionHandler):
         game.roll = roll
         game.result += [rspmodel.RollResult(roll=roll, player=player)]
         self.handle_roll_action(game, roll)
+        apply_rule(game, player, self.get_roll_outcome(game, roll))
+
+@effect(end_play, touchdown, start_drive)
+def end_kick_return(game):
+    if game.play == Play.PUNT:
+        set_first_down(game)
+        game.down = 0
+        end_play(game)
+    elif game.play == None:
+        if game.ballpos >= 100:
+            touchdown(game)
+        else:
+            start_drive(game)
+    else:
+        raise Exception(f"Unexpected play for kick return: {game.play}")
+
+# move the game on from a kickoff or punt that lands at the ballpos of the receiving team
+@effect(end_kick_return, State.TOUCHBACK_CHOICE, State.KICK_RETURN)
+def land_kick(game):
+    if game.ballpos <= -10:
+        game.ballpos = 20
+        end_kick_return(game)
+
+    elif game.ballpos <= 0:
+        game.state = State.TOUCHBACK_CHOICE
+        game.actions[game.possession] = ['TOUCHBACK_CHOICE']
+
+    else:
+        game.state = State.KICK_RETURN
+        game.actions[game.possession] = ['ROLL']
 
 class KickoffActionHandler(RollActionHandler):
     states = [State.KICKOFF]
@@ -205,23 +270,6 @@ class KickoffActionHandler(RollActionHandler):
 
         switch_possession(game)
 
-        if sum(roll) <= 8:
-            game.result += [OutOfBoundsKickResult()]
-            game.ballpos = 40
-            end_kick_return(game)
-
-        elif game.ballpos <= -10:
-            game.ballpos = 20
-            end_kick_return(game)
-
-        elif game.ballpos <= 0:
-            game.state = State.TOUCHBACK_CHOICE
-            game.actions[game.possession] = ['TOUCHBACK_CHOICE']
-
-        else:
-            game.state = State.KICK_RETURN
-            game.actions[game.possession] = ['ROLL']
-
 class OnsideKickActionHandler(RollActionHandler):
     states = [State.ONSIDE_KICK]
     allowed_counts = [2]
@@ -229,66 +277,43 @@ class OnsideKickActionHandler(RollActionHandler):
     def handle_roll_action(self, game, roll):
         game.ballpos += 10
 
-        if sum(roll) > 5:
-            switch_possession(game)
-        
-        set_call_play_state(game)
-        set_first_down(game)
+@effect(start_drive)
+def receive_onside_kick(game):
+    switch_possession(game)
+    start_drive(game)
 
 class KickReturnActionHandler(RollActionHandler):
     states = [State.KICK_RETURN]
     allowed_counts = [1]
 
     def handle_roll_action(self, game, roll):
-        [roll] = roll
-        
-        game.ballpos += 5 * roll
-
-        if roll == 1:
-            game.state = State.KICK_RETURN_1
-            game.actions[game.possession] = ['ROLL_AGAIN_CHOICE']
-        elif roll == 6:
-            game.state = State.KICK_RETURN_6
-            game.actions[game.possession] = ['ROLL']
-        else:
-            end_kick_return(game)
+        game.ballpos += 5 * sum(roll)
 
 class KickReturn6ActionHandler(RollActionHandler):
     states = [State.KICK_RETURN_6]
     allowed_counts = [1]
 
+    # the rule for a second 6 sets the ball in the end zone
     def handle_roll_action(self, game, roll):
-        [roll] = roll
-        
-        if roll == 6:
-            game.ballpos = 100
-        else:
-            game.ballpos += 5 * roll
-        
-        end_kick_return(game)
+        game.ballpos += 5 * sum(roll)
 
-class KickReturn1ActionHandler(ActionHandler):
-    states = [State.KICK_RETURN_1]
-    actions = [rspmodel.RollAgainChoiceAction]
+@effect(end_kick_return)
+def roll_again_kick_return(game):
+    game.roll = roll_dice(count=1)
+    game.result += [rspmodel.RollResult(roll=game.roll, player=game.possession)]
 
-    def handle_action(self, game, player, action):
-        
-        if action.choice == RollAgainChoice.HOLD:
-            end_kick_return(game)
-            return
-        
-        # choice is ROLL
-        game.roll = roll_dice(count=1)
-        game.result += [rspmodel.RollResult(roll=game.roll, player=player)]
+    [roll] = game.roll
+    game.ballpos += 5 * roll
 
-        [roll] = game.roll
-        game.ballpos += 5 * roll
+    if roll == 1:
+        switch_possession(game)
+        game.result += [TurnoverResult(type = TurnoverType.FUMBLE)]
+    
+    end_kick_return(game)
 
-        if roll == 1:
-            switch_possession(game)
-            game.result += [TurnoverResult(type = TurnoverType.FUMBLE)]
-        
-        end_kick_return(game)
+class KickReturn1ActionHandler(ChoiceActionHandler):
+    states = [State.KICK_RETURN_1]
+    actions = [rspmodel.RollAgainChoiceAction]
 
 class KickoffElectionActionHandler(ActionHandler):
     states = [State.KICKOFF_ELECTION]
@@ -305,106 +330,50 @@ class KickoffElectionActionHandler(ActionHandler):
         game.possession = kicker
         game.result += [KickoffElectionResult(choice = action.choice)]
 
-        set_kickoff_state(game, 35)
+        apply_rule(game, player, action.choice)
 
-class KickoffChoiceActionHandler(ActionHandler):
+class KickoffChoiceActionHandler(ChoiceActionHandler):
     states = [State.KICKOFF_CHOICE]
     actions = [rspmodel.KickoffChoiceAction]
-        
-    def handle_action(self, game, player, action):
-        if action.choice == KickoffChoice.REGULAR:
-            game.state = State.KICKOFF
-        else: # choice is ONSIDE
-            game.state = State.ONSIDE_KICK
-        
-        game.actions[player] = ['ROLL']
 
-class TouchbackChoiceActionHandler(ActionHandler):
+class TouchbackChoiceActionHandler(ChoiceActionHandler):
     states = [State.TOUCHBACK_CHOICE]
     actions = [rspmodel.TouchbackChoiceAction]
-        
-    def handle_action(self, game, player, action):
-        if action.choice == TouchbackChoice.TOUCHBACK:
-            game.ballpos = 20
-            end_kick_return(game)
-        else: # choice is RETURN
-            game.state = State.KICK_RETURN
-            game.actions[player] = ['ROLL']
 
 
-class PlayCallActionHandler(ActionHandler):
+class PlayCallActionHandler(ChoiceActionHandler):
     states = [State.PLAY_CALL]
     actions = [rspmodel.CallPlayAction]
+    choice_field = 'play'
 
-    def handle_action(self, game, player, action):
-        game.play = action.play
-
-        if action.play == Play.SHORT_RUN:
-            game.state = State.SHORT_RUN
-        elif action.play == Play.LONG_RUN:
-            game.state = State.LONG_RUN
-        elif action.play == Play.SHORT_PASS:
-            game.state = State.SHORT_PASS
-        elif action.play == Play.LONG_PASS:
-            game.state = State.LONG_PASS
-        elif action.play == Play.BOMB:
-            game.state = State.BOMB
-        elif action.play == Play.PUNT:
-            game.state = Play.PUNT
-        else:
-            raise IllegalActionException("Unexpected play")
-        
+class ShortRunActionHandler(RspActionHandler):
+    states = [State.SHORT_RUN, State.SHORT_RUN_CONT]
+
+# continue a short run or short pass with another RSP, after a gain that did
+# not reach the end zone
+def continue_short_play(game, state):
+    if game.ballpos >= 100:
+        end_play(game)
+    else:
+        game.state = state
         game.actions = {
             'home': ['RSP'],
             'away': ['RSP']
         }
 
-class ShortRunActionHandler(RspActionHandler):
-    states = [State.SHORT_RUN, State.SHORT_RUN_CONT]
-
-    def handle_rsp_action(self, game, winner):
-        opponent = get_opponent(game.possession)
-
-        # if this is a continuation, we can treat a loss as a tie
-        if game.state == State.SHORT_RUN_CONT and winner == opponent:
-            winner = None
-        
-        if winner == game.possession:
-            game.ballpos += 5
-            game.result += [GainResult(
-                play = Play.SHORT_RUN,
-                player = game.possession,
-                yards = 5
-            )]
-            
-            if game.ballpos >= 100:
-                end_play(game)
-            else:
-                game.state = State.SHORT_RUN_CONT
-                game.actions = {
-                    'home': ['RSP'],
-                    'away': ['RSP']
-                }
-        elif winner == opponent:
-            game.state = State.SACK_ROLL
-            game.actions[opponent] = ['ROLL']
-
-        else:
-            end_play(game)
+@effect(end_play, State.SHORT_RUN_CONT)
+def gain_short_run(game):
+    game.ballpos += 5
+    game.result += [GainResult(
+        play = Play.SHORT_RUN,
+        player = game.possession,
+        yards = 5
+    )]
+    continue_short_play(game, State.SHORT_RUN_CONT)
 
 class LongRunActionHandler(RspActionHandler):
     states = [State.LONG_RUN]
 
-    def handle_rsp_action(self, game, winner):
-        if winner == game.possession:
-            game.state = State.LONG_RUN_ROLL
-            game.actions[game.possession] = ['ROLL']
-        elif winner == get_opponent(game.possession):
-            game.state = State.SACK_ROLL
-            game.actions[get_opponent(game.possession)] = ['ROLL']
-        else:
-            end_play(game)
-
 class LongRunRollActionHandler(RollActionHandler):
     states = [State.LONG_RUN_ROLL]
     allowed_counts = [1]
@@ -420,63 +389,22 @@ class LongRunRollActionHandler(RollActionHandler):
                 yards = distance
             )]
 
-        if roll == 1:
-            game.state = State.FUMBLE
-            game.actions = {
-                'home': ['RSP'],
-                'away': ['RSP']
-            }
-        else:
-            end_play(game)
-
 class ShortPassActionHandler(RspActionHandler):
     states = [State.SHORT_PASS, State.SHORT_PASS_CONT]
 
-    def handle_rsp_action(self, game, winner):
-        opponent = get_opponent(game.possession)
-
-        # if this is a continuation, we can treat a loss as a tie
-        if game.state == State.SHORT_PASS_CONT and winner == opponent:
-            winner = None
-        
-        if winner == game.possession:
-            game.ballpos += 10
-            game.result += [rspmodel.GainResult(
-                play = Play.SHORT_PASS,
-                player = game.possession,
-                yards = 10
-            )]
-            
-            if game.ballpos >= 100:
-                end_play(game)
-            else:
-                game.state = State.SHORT_PASS_CONT
-                game.actions = {
-                    'home': ['RSP'],
-                    'away': ['RSP']
-                }
-        elif winner == opponent:
-            game.state = State.SACK_CHOICE
-            game.actions[opponent] = ['SACK_CHOICE']
-
-        else:
-            game.result += [rspmodel.IncompletePassResult()]
-            end_play(game)
+@effect(end_play, State.SHORT_PASS_CONT)
+def gain_short_pass(game):
+    game.ballpos += 10
+    game.result += [rspmodel.GainResult(
+        play = Play.SHORT_PASS,
+        player = game.possession,
+        yards = 10
+    )]
+    continue_short_play(game, State.SHORT_PASS_CONT)
 
 class LongPassActionHandler(RspActionHandler):
     states = [State.LONG_PASS]
 
-    def handle_rsp_action(self, game, winner):
-        if winner == game.possession:
-            game.state = State.LONG_PASS_ROLL
-            game.actions[game.possession] = ['ROLL']
-        elif winner == get_opponent(game.possession):
-            game.state = State.SACK_CHOICE
-            game.actions[get_opponent(game.possession)] = ['SACK_CHOICE']
-        else:
-            game.result += [rspmodel.IncompletePassResult()]
-            end_play(game)
-
 class LongPassRollActionHandler(RollActionHandler):
     states = [State.LONG_PASS_ROLL]
     allowed_counts = [1]
@@ -495,25 +423,10 @@ class LongPassRollActionHandler(RollActionHandler):
                 yards = distance
             )]
 
-        end_play(game)
-
 class BombActionHandler(RspActionHandler):
     states = [State.BOMB]
 
-    def handle_rsp_action(self, game, winner):
-        opponent = get_opponent(game.possession)
-
-        if winner == game.possession:
-            game.state = State.BOMB_ROLL
-            game.actions[game.possession] = ['ROLL']
-            game.roll = []
-        elif winner == opponent:
-            game.state = State.SACK_CHOICE
-            game.actions[opponent] = ['SACK_CHOICE']
-        else:
-            game.result += [rspmodel.IncompletePassResult()]
-            end_play(game)
-
+@effect(end_play)
 def end_bomb(game):
     roll = sum(game.roll)
     
@@ -536,6 +449,7 @@ def end_bomb(game):
 
     end_play(game)
 
+@effect(end_bomb, State.BOMB_ROLL, State.BOMB_CHOICE)
 def process_bomb_roll(game):
     roll = roll_dice(1)
     game.roll += roll
@@ -562,50 +476,17 @@ class BombRollActionHandler(ActionHandler):
         if action.count != 1:
             raise IllegalActionException("Bomb roll must have count=1")
 
-        process_bomb_roll(game)
+        # the roll is made by the effect of the rule, as it is for a roll again
+        apply_rule(game, player, None)
 
-class BombChoiceActionHandler(ActionHandler):
+class BombChoiceActionHandler(ChoiceActionHandler):
     states = [State.BOMB_CHOICE]
     actions = [rspmodel.RollAgainChoiceAction]
 
-    def handle_action(self, game, player, action):
-        if action.choice == RollAgainChoice.ROLL:
-            process_bomb_roll(game)
-        else: # choice is HOLD
-            end_bomb(game)
-
 
 class PuntActionHandler(RspActionHandler):
     states = [State.PUNT]
 
-    def handle_rsp_action(self, game, winner):
-        
-        opponent = get_opponent(game.possession)
-
-        if winner == game.possession:
-            game.state = State.FAKE_PUNT_CHOICE
-            game.actions[game.possession] = ['FAKE_KICK_CHOICE']
-        elif winner == opponent:
-            game.state = State.PUNT_BLOCK
-            game.actions[opponent] = ['ROLL']
-        else:
-            game.state = State.PUNT_KICK
-            game.actions[game.possession] = ['ROLL']
-
-def end_kick_return(game):
-    if game.play == Play.PUNT:
-        set_first_down(game)
-        game.down = 0
-        end_play(game)
-    elif game.play == None:
-        if game.ballpos >= 100:
-            touchdown(game)
-        else:
-            set_call_play_state(game)
-            set_first_down(game)
-    else:
-        raise Exception(f"Unexpected play for kick return: {game.play}")
-
 class PuntKickActionHandler(RollActionHandler):
     states = [State.PUNT_KICK]
     allowed_counts = [1, 2, 3]
@@ -617,20 +498,16 @@ class PuntKickActionHandler(RollActionHandler):
         switch_possession(game)
         game.firstDown = None
 
-        if game.ballpos <= -10:
-            game.ballpos = 20
-            end_kick_return(game)
-        elif game.ballpos <= 0:
-            game.state = State.TOUCHBACK_CHOICE
-            game.actions[game.possession] = ['TOUCHBACK_CHOICE']
-        elif game.ballpos <= 10:
-            set_first_down(game)
-            end_kick_return(game)
-            game.result += [CoffinCornerResult()]
-        else:
-            game.state = State.KICK_RETURN
-            game.actions[game.possession] = ['ROLL']
+@effect(end_kick_return, land_kick)
+def land_punt(game):
+    if 0 < game.ballpos <= 10:
+        set_first_down(game)
+        end_kick_return(game)
+        game.result += [CoffinCornerResult()]
+    else:
+        land_kick(game)
 
+@effect(end_play)
 def process_fake_kick(game):
     game.roll = roll_dice(1)
     game.result += [
@@ -645,42 +522,21 @@ def process_fake_kick(game):
     game.ballpos += min(distance_to_goal, distance)
     end_play(game)
 
-class FakePuntChoiceActionHandler(ActionHandler):
+class FakePuntChoiceActionHandler(ChoiceActionHandler):
     states = [State.FAKE_PUNT_CHOICE]
     actions = [FakeKickChoiceAction]
 
-    def handle_action(self, game, player, action):
-        
-        if action.choice == FakeKickChoice.KICK:
-            game.state = State.PUNT_KICK
-            game.actions[game.possession] = ['ROLL']        
-        else: # choice is FAKE
-            process_fake_kick(game)
-
 class KickBlockActionHandler(RollActionHandler):
     states = [State.PUNT_BLOCK]
     allowed_counts = [1]
 
-    def handle_roll_action(self, game, roll):
-        [roll] = roll
-
-        if roll != 1:
-            if game.state == State.PUNT_BLOCK:
-                game.state = State.PUNT_KICK
-            else:
-                raise Exception(f"Unexpected state for kick block: {game.state}")
-            
-            game.actions[game.possession] = ['ROLL']
-
-            return
-
-        # Here, the roll is 1, so it is a blocked kick
-        game.result += [BlockedKickResult()]
-        game.ballpos -= 10
-        switch_possession(game)
-        set_first_down(game)
-        game.down = 0
-        end_play(game)
+@effect(end_play)
+def block_kick(game):
+    game.ballpos -= 10
+    switch_possession(game)
+    set_first_down(game)
+    game.down = 0
+    end_play(game)
 
 
 class SackActionHandler(RollActionHandler):
@@ -699,8 +555,6 @@ class SackActionHandler(RollActionHandler):
             player = game.possession,
             yards = distance
         )]
-        
-        end_play(game)
 
     def get_sack_distance(self, play, roll):
         if play == Play.SHORT_RUN:
@@ -711,66 +565,58 @@ class SackActionHandler(RollActionHandler):
         raise Exception(f'Unexpected play [{play}] for sack roll')
 
 class FumbleActionHandler(RspActionHandler):
+    # This handler handles a Fumble only from a Long Run
+    # in the case of a fumbled kickoff or punt return, the kicking team
+    # immediately recovers
+    # The player with possession has the "advantage" - a win or tie
+    # retains possession
     states = [State.FUMBLE]
 
-    def handle_rsp_action(self, game, winner):
-        # This handler handles a Fumble only from a Long Run
-        # in the case of a fumbled kickoff or punt return, the kicking team
-        # immediately recovers
+@effect(end_play)
+def end_fumble(game):
+    set_call_play_state(game)
+    end_play(game)
+
+@effect(end_fumble)
+def lose_fumble(game):
+    switch_possession(game)
+    game.result += [TurnoverResult(type = TurnoverType.FUMBLE)]
 
-        # The player with possession has the "advantage" - a win or tie
-        # retains possession
-        if winner == get_opponent(game.possession):
+    # it is possible to recover a fumble in own goal
+    if game.ballpos <= 0:
+        game.ballpos = 20
 
-            switch_possession(game)
-            game.result += [TurnoverResult(type = TurnoverType.FUMBLE)]
+    set_first_down(game)
+    game.down = 0 # mark down as 0, so that when the play is ended, it is first down
+    end_fumble(game)
+
+def get_pass_sack_yards(play):
+    if play == Play.SHORT_PASS:
+        return 5
+    if play == Play.LONG_PASS:
+        return 10
+    if play == Play.BOMB:
+        return 15
+    
+    raise Exception(f'Unexpected play for SackChoice: {play}')
 
-            # it is possible to recover a fumble in own goal
-            if game.ballpos <= 0:
-                game.ballpos = 20
+@effect(end_play)
+def sack_pass(game):
+    sack_yards = get_pass_sack_yards(game.play)
 
-            set_first_down(game)
-            game.down = 0 # mark down as 0, so that when the play is ended, it is first down
+    game.ballpos -= sack_yards
+    game.result += [rspmodel.LossResult(
+        play = game.play,
+        player = game.possession,
+        yards = sack_yards
+    )]
 
-        set_call_play_state(game)
-        end_play(game)
+    end_play(game)
 
-class SackChoiceActionHandler(ActionHandler):
+class SackChoiceActionHandler(ChoiceActionHandler):
     states = [State.SACK_CHOICE]
     actions = [rspmodel.SackChoiceAction]
 
-    def handle_action(self, game, player, action):
-        if action.choice == SackChoice.SACK:
-            self.handle_sack_choice(game, player)
-        else: # choice is PICK
-            self.handle_pick_choice(game, player)
-
-    def get_sack_yards(self, play):
-        if play == Play.SHORT_PASS:
-            return 5
-        if play == Play.LONG_PASS:
-            return 10
-        if play == Play.BOMB:
-            return 15
-        
-        raise Exception(f'Unexpected play for SackChoice: {play}')
-
-    def handle_sack_choice(self, game, player):
-        sack_yards = self.get_sack_yards(game.play)
-
-        game.ballpos -= sack_yards
-        game.result += [rspmodel.LossResult(
-            play = game.play,
-            player = game.possession,
-            yards = sack_yards
-        )]
-
-        end_play(game)
-
-    def handle_pick_choice(self, game, player):
-        game.state = State.PICK_ROLL
-        game.actions[player] = ['ROLL']
-
 
 # Update the given Game from the point where the ball is thrown,
 # and will be intercepted
@@ -794,25 +640,26 @@ def complete_interception(game, throw_distance):
         switch_possession(game)
         game.firstDown = None
 
+INTERCEPTION_TARGETS = (end_play, State.PICK_TOUCHBACK_CHOICE, State.PICK_RETURN)
+
+@effect(end_play)
+def miss_pick(game):
+    end_play(game)
+    game.result += [IncompletePassResult()]
+
+@effect(*INTERCEPTION_TARGETS)
+def intercept_short_pass(game):
+    complete_interception(game, 10)
+
 class PickRollActionHandler(RollActionHandler):
     states = [State.PICK_ROLL]
     allowed_counts = [1]
 
-    def handle_roll_action(self, game, roll):
+    # the outcome of a successful pick is the play, as only a short pass is
+    # intercepted without a distance roll
+    def get_roll_outcome(self, game, roll):
         [roll] = roll
-        
-        success = self.is_pick_successful(game.play, roll)
-
-        if not success:
-            end_play(game)
-            game.result += [IncompletePassResult()]
-            return
-        
-        if game.play == Play.SHORT_PASS:
-            complete_interception(game, 10)
-        else:
-            game.state = State.DISTANCE_ROLL
-            game.actions[game.possession] = ['ROLL']
+        return game.play if self.is_pick_successful(game.play, roll) else NO_PICK
     
     def is_pick_successful(self, play, roll):
         if play == Play.SHORT_PASS:
@@ -828,23 +675,24 @@ class DistanceRollActionHandler(RollActionHandler):
     states = [State.DISTANCE_ROLL]
     allowed_counts = [1,3]
 
-    def handle_roll_action(self, game, roll):
-        distance = self.get_throw_distance(game.play, roll)
-        complete_interception(game, distance)
+def get_throw_distance(play, roll):
+    if play == Play.LONG_PASS:
+        if (len(roll) != 1):
+            raise IllegalActionException("DistanceRoll for a ShortPass must be 1 die")
+        return 10 + 5*sum(roll)
+    
+    if play == Play.BOMB:
+        if (len(roll) != 3):
+            raise IllegalActionException("DistanceRoll for a Bomb must be 3 dice")
+        return 5*sum(roll)
+    
+    raise Exception(f"Unexpected play for DistanceRoll: {play}")
 
-    def get_throw_distance(self, play, roll):
-        if play == Play.LONG_PASS:
-            if (len(roll) != 1):
-                raise IllegalActionException("DistanceRoll for a ShortPass must be 1 die")
-            return 10 + 5*sum(roll)
-        
-        if play == Play.BOMB:
-            if (len(roll) != 3):
-                raise IllegalActionException("DistanceRoll for a Bomb must be 3 dice")
-            return 5*sum(roll)
-        
-        raise Exception(f"Unexpected play for DistanceRoll: {play}")
+@effect(*INTERCEPTION_TARGETS)
+def intercept_thrown_pass(game):
+    complete_interception(game, get_throw_distance(game.play, game.roll))
 
+@effect(end_play)
 def complete_pick_return(game):
     set_first_down(game)
     game.down = 0
@@ -855,58 +703,21 @@ class PickReturnActionHandler(RollActionHandler):
     allowed_counts = [1]
 
     def handle_roll_action(self, game, roll):
-        [roll] = roll
-        
-        game.ballpos += 5 * roll
-
-        if roll == 6:
-            game.state = State.PICK_RETURN_6
-            game.actions[game.possession] = ['ROLL']
-        else:
-            complete_pick_return(game)
+        game.ballpos += 5 * sum(roll)
 
 class PickReturn6ActionHandler(RollActionHandler):
     states = [State.PICK_RETURN_6]
     allowed_counts = [1]
 
-    def handle_roll_action(self, game, roll):
-        [roll] = roll
-        
-        if roll == 6:
-            game.ballpos = 100
-            end_play(game)
-        else:
-            complete_pick_return(game)
-
-class PickTouchbackChoiceActionHandler(ActionHandler):
+class PickTouchbackChoiceActionHandler(ChoiceActionHandler):
     states = [State.PICK_TOUCHBACK_CHOICE]
     actions = [rspmodel.TouchbackChoiceAction]
-        
-    def handle_action(self, game, player, action):
-        if action.choice == TouchbackChoice.TOUCHBACK:
-            game.result += [rspmodel.TouchbackResult()]
-            game.ballpos = 20
-            complete_pick_return(game)
-        else: # choice is RETURN
-            game.state = State.PICK_RETURN
-            game.actions[player] = ['ROLL']
 
-class PatChoiceActionHandler(ActionHandler):
+class PatChoiceActionHandler(ChoiceActionHandler):
     states = [State.PAT_CHOICE]
     actions = [rspmodel.PatChoiceAction]
 
-    def handle_action(self, game, player, action):
-        game.ballpos = 95
-        if action.choice == PatChoice.ONE_POINT:
-            game.state = State.EXTRA_POINT
-            game.actions[player] = ['ROLL']
-        else: # choice is TWO_POINT
-            game.state = State.EXTRA_POINT_2
-            game.actions = {
-                'home': ['RSP'],
-                'away': ['RSP']
-            }
-
+@effect(State.GAME_OVER, State.KICKOFF_CHOICE)
 def end_pat(game):
     if game.playCount > GAME_LENGTH:
         set_game_over_state(game)
@@ -918,20 +729,148 @@ class ExtraPointKickActionHandler(RollActionHandler):
     states = [State.EXTRA_POINT]
     allowed_counts = [2]
 
-    def handle_roll_action(self, game, roll):
-        
-        if sum(roll) >= 4:
-            game.score[game.possession] += 1
-            game.result += [ScoreResult(type = 'PAT_1')]
-        
-        end_pat(game)
+@effect(end_pat)
+def score_extra_point(game):
+    game.score[game.possession] += 1
+    game.result += [ScoreResult(type = 'PAT_1')]
+    end_pat(game)
 
 class TwoPointConversionActionHandler(RspActionHandler):
     states = [State.EXTRA_POINT_2]
 
-    def handle_rsp_action(self, game, winner):
-        if winner == game.possession:
-            game.score[game.possession] += 2
-            game.result += [ScoreResult(type = 'PAT_2')]
-        
-        end_pat(game)
\ No newline at end of file
+@effect(end_pat)
+def score_two_point_conversion(game):
+    game.score[game.possession] += 2
+    game.result += [ScoreResult(type = 'PAT_2')]
+    end_pat(game)
+
+
+# The transitions of every action, keyed by its outcome
+# Transitions that depend on the rest of the game, such as the ballpos or the
+# play, are completed by the effect of the rule, whose targets are declared
+RULES = [
+    Rule(State.COIN_TOSS, 'RSP', WIN, target=State.KICKOFF_ELECTION, actions={ACTOR: ['KICKOFF_ELECTION'], OPPONENT: ['POLL']}),
+    # during the cointoss a tie is a redo
+    Rule(State.COIN_TOSS, 'RSP', TIE, target=State.COIN_TOSS, actions={BOTH: ['RSP']}),
+
+    Rule(State.KICKOFF_ELECTION, 'KICKOFF_ELECTION', KickoffElectionChoice.KICK, target=State.KICKOFF_CHOICE, updates={'ballpos': 35, 'firstDown': None}, actions={OFFENSE: ['KICKOFF_CHOICE']}),
+    Rule(State.KICKOFF_ELECTION, 'KICKOFF_ELECTION', KickoffElectionChoice.RECIEVE, target=State.KICKOFF_CHOICE, updates={'ballpos': 35, 'firstDown': None}, actions={OFFENSE: ['KICKOFF_CHOICE']}),
+
+    Rule(State.KICKOFF_CHOICE, 'KICKOFF_CHOICE', KickoffChoice.REGULAR, target=State.KICKOFF, actions={ACTOR: ['ROLL']}),
+    Rule(State.KICKOFF_CHOICE, 'KICKOFF_CHOICE', KickoffChoice.ONSIDE, target=State.ONSIDE_KICK, actions={ACTOR: ['ROLL']}),
+
+    Rule(State.KICKOFF, 'ROLL', range(3, 9), updates={'ballpos': 40}, results=[OutOfBoundsKickResult], effect=end_kick_return),
+    Rule(State.KICKOFF, 'ROLL', range(9, 19), effect=land_kick),
+
+    Rule(State.ONSIDE_KICK, 'ROLL', range(2, 6), effect=start_drive),
+    Rule(State.ONSIDE_KICK, 'ROLL', range(6, 13), effect=receive_onside_kick),
+
+    Rule(State.TOUCHBACK_CHOICE, 'TOUCHBACK_CHOICE', TouchbackChoice.TOUCHBACK, updates={'ballpos': 20}, effect=end_kick_return),
+    Rule(State.TOUCHBACK_CHOICE, 'TOUCHBACK_CHOICE', TouchbackChoice.RETURN, target=State.KICK_RETURN, actions={ACTOR: ['ROLL']}),
+
+    Rule(State.KICK_RETURN, 'ROLL', 1, target=State.KICK_RETURN_1, actions={OFFENSE: ['ROLL_AGAIN_CHOICE']}),
+    Rule(State.KICK_RETURN, 'ROLL', range(2, 6), effect=end_kick_return),
+    Rule(State.KICK_RETURN, 'ROLL', 6, target=State.KICK_RETURN_6, actions={OFFENSE: ['ROLL']}),
+
+    Rule(State.KICK_RETURN_6, 'ROLL', range(1, 6), effect=end_kick_return),
+    Rule(State.KICK_RETURN_6, 'ROLL', 6, updates={'ballpos': 100}, effect=end_kick_return),
+
+    Rule(State.KICK_RETURN_1, 'ROLL_AGAIN_CHOICE', RollAgainChoice.HOLD, effect=end_kick_return),
+    Rule(State.KICK_RETURN_1, 'ROLL_AGAIN_CHOICE', RollAgainChoice.ROLL, effect=roll_again_kick_return),
+
+    Rule(State.PLAY_CALL, 'CALL_PLAY', Play.SHORT_RUN, target=State.SHORT_RUN, updates={'play': Play.SHORT_RUN}, actions={BOTH: ['RSP']}),
+    Rule(State.PLAY_CALL, 'CALL_PLAY', Play.LONG_RUN, target=State.LONG_RUN, updates={'play': Play.LONG_RUN}, actions={BOTH: ['RSP']}),
+    Rule(State.PLAY_CALL, 'CALL_PLAY', Play.SHORT_PASS, target=State.SHORT_PASS, updates={'play': Play.SHORT_PASS}, actions={BOTH: ['RSP']}),
+    Rule(State.PLAY_CALL, 'CALL_PLAY', Play.LONG_PASS, target=State.LONG_PASS, updates={'play': Play.LONG_PASS}, actions={BOTH: ['RSP']}),
+    Rule(State.PLAY_CALL, 'CALL_PLAY', Play.BOMB, target=State.BOMB, updates={'play': Play.BOMB}, actions={BOTH: ['RSP']}),
+    Rule(State.PLAY_CALL, 'CALL_PLAY', Play.PUNT, target=State.PUNT, updates={'play': Play.PUNT}, actions={BOTH: ['RSP']}),
+
+    Rule(State.SHORT_RUN, 'RSP', WIN, effect=gain_short_run),
+    Rule(State.SHORT_RUN, 'RSP', LOSS, target=State.SACK_ROLL, actions={DEFENSE: ['ROLL']}),
+    Rule(State.SHORT_RUN, 'RSP', TIE, effect=end_play),
+
+    # in a continuation, a loss is treated as a tie
+    Rule(State.SHORT_RUN_CONT, 'RSP', WIN, effect=gain_short_run),
+    Rule(State.SHORT_RUN_CONT, 'RSP', LOSS, effect=end_play),
+    Rule(State.SHORT_RUN_CONT, 'RSP', TIE, effect=end_play),
+
+    Rule(State.LONG_RUN, 'RSP', WIN, target=State.LONG_RUN_ROLL, actions={OFFENSE: ['ROLL']}),
+    Rule(State.LONG_RUN, 'RSP', LOSS, target=State.SACK_ROLL, actions={DEFENSE: ['ROLL']}),
+    Rule(State.LONG_RUN, 'RSP', TIE, effect=end_play),
+
+    Rule(State.LONG_RUN_ROLL, 'ROLL', 1, target=State.FUMBLE, actions={BOTH: ['RSP']}),
+    Rule(State.LONG_RUN_ROLL, 'ROLL', range(2, 7), effect=end_play),
+
+    Rule(State.FUMBLE, 'RSP', WIN, effect=end_fumble),
+    Rule(State.FUMBLE, 'RSP', LOSS, effect=lose_fumble),
+    Rule(State.FUMBLE, 'RSP', TIE, effect=end_fumble),
+
+    Rule(State.SHORT_PASS, 'RSP', WIN, effect=gain_short_pass),
+    Rule(State.SHORT_PASS, 'RSP', LOSS, target=State.SACK_CHOICE, actions={DEFENSE: ['SACK_CHOICE']}),
+    Rule(State.SHORT_PASS, 'RSP', TIE, results=[IncompletePassResult], effect=end_play),
+
+    # in a continuation, a loss is treated as a tie
+    Rule(State.SHORT_PASS_CONT, 'RSP', WIN, effect=gain_short_pass),
+    Rule(State.SHORT_PASS_CONT, 'RSP', LOSS, results=[IncompletePassResult], effect=end_play),
+    Rule(State.SHORT_PASS_CONT, 'RSP', TIE, results=[IncompletePassResult], effect=end_play),
+
+    Rule(State.LONG_PASS, 'RSP', WIN, target=State.LONG_PASS_ROLL, actions={OFFENSE: ['ROLL']}),
+    Rule(State.LONG_PASS, 'RSP', LOSS, target=State.SACK_CHOICE, actions={DEFENSE: ['SACK_CHOICE']}),
+    Rule(State.LONG_PASS, 'RSP', TIE, results=[IncompletePassResult], effect=end_play),
+
+    Rule(State.LONG_PASS_ROLL, 'ROLL', range(1, 7), effect=end_play),
+
+    Rule(State.BOMB, 'RSP', WIN, target=State.BOMB_ROLL, updates={'roll': []}, actions={OFFENSE: ['ROLL']}),
+    Rule(State.BOMB, 'RSP', LOSS, target=State.SACK_CHOICE, actions={DEFENSE: ['SACK_CHOICE']}),
+    Rule(State.BOMB, 'RSP', TIE, results=[IncompletePassResult], effect=end_play),
+
+    Rule(State.BOMB_ROLL, 'ROLL', None, effect=process_bomb_roll),
+
+    Rule(State.BOMB_CHOICE, 'ROLL_AGAIN_CHOICE', RollAgainChoice.ROLL, effect=process_bomb_roll),
+    Rule(State.BOMB_CHOICE, 'ROLL_AGAIN_CHOICE', RollAgainChoice.HOLD, effect=end_bomb),
+
+    Rule(State.PUNT, 'RSP', WIN, target=State.FAKE_PUNT_CHOICE, actions={OFFENSE: ['FAKE_KICK_CHOICE']}),
+    Rule(State.PUNT, 'RSP', LOSS, target=State.PUNT_BLOCK, actions={DEFENSE: ['ROLL']}),
+    Rule(State.PUNT, 'RSP', TIE, target=State.PUNT_KICK, actions={OFFENSE: ['ROLL']}),
+
+    Rule(State.FAKE_PUNT_CHOICE, 'FAKE_KICK_CHOICE', FakeKickChoice.KICK, target=State.PUNT_KICK, actions={OFFENSE: ['ROLL']}),
+    Rule(State.FAKE_PUNT_CHOICE, 'FAKE_KICK_CHOICE', FakeKickChoice.FAKE, effect=process_fake_kick),
+
+    Rule(State.PUNT_BLOCK, 'ROLL', 1, results=[BlockedKickResult], effect=block_kick),
+    Rule(State.PUNT_BLOCK, 'ROLL', range(2, 7), target=State.PUNT_KICK, actions={OFFENSE: ['ROLL']}),
+
+    Rule(State.PUNT_KICK, 'ROLL', range(1, 19), effect=land_punt),
+
+    Rule(State.SACK_ROLL, 'ROLL', range(1, 7), effect=end_play),
+
+    Rule(State.SACK_CHOICE, 'SACK_CHOICE', SackChoice.SACK, effect=sack_pass),
+    Rule(State.SACK_CHOICE, 'SACK_CHOICE', SackChoice.PICK, target=State.PICK_ROLL, actions={ACTOR: ['ROLL']}),
+
+    Rule(State.PICK_ROLL, 'ROLL', NO_PICK, effect=miss_pick),
+    Rule(State.PICK_ROLL, 'ROLL', Play.SHORT_PASS, effect=intercept_short_pass),
+    Rule(State.PICK_ROLL, 'ROLL', Play.LONG_PASS, target=State.DISTANCE_ROLL, actions={OFFENSE: ['ROLL']}),
+    Rule(State.PICK_ROLL, 'ROLL', Play.BOMB, target=State.DISTANCE_ROLL, actions={OFFENSE: ['ROLL']}),
+
+    Rule(State.DISTANCE_ROLL, 'ROLL', range(1, 19), effect=intercept_thrown_pass),
+
+    Rule(State.PICK_TOUCHBACK_CHOICE, 'TOUCHBACK_CHOICE', TouchbackChoice.TOUCHBACK, updates={'ballpos': 20}, results=[rspmodel.TouchbackResult], effect=complete_pick_return),
+    Rule(State.PICK_TOUCHBACK_CHOICE, 'TOUCHBACK_CHOICE', TouchbackChoice.RETURN, target=State.PICK_RETURN, actions={ACTOR: ['ROLL']}),
+
+    Rule(State.PICK_RETURN, 'ROLL', range(1, 6), effect=complete_pick_return),
+    Rule(State.PICK_RETURN, 'ROLL', 6, target=State.PICK_RETURN_6, actions={OFFENSE: ['ROLL']}),
+
+    Rule(State.PICK_RETURN_6, 'ROLL', range(1, 6), effect=complete_pick_return),
+    Rule(State.PICK_RETURN_6, 'ROLL', 6, updates={'ballpos': 100}, effect=end_play),
+
+    Rule(State.PAT_CHOICE, 'PAT_CHOICE', PatChoice.ONE_POINT, target=State.EXTRA_POINT, updates={'ballpos': 95}, actions={ACTOR: ['ROLL']}),
+    Rule(State.PAT_CHOICE, 'PAT_CHOICE', PatChoice.TWO_POINT, target=State.EXTRA_POINT_2, updates={'ballpos': 95}, actions={BOTH: ['RSP']}),
+
+    Rule(State.EXTRA_POINT, 'ROLL', range(2, 4), effect=end_pat),
+    Rule(State.EXTRA_POINT, 'ROLL', range(4, 13), effect=score_extra_point),
+
+    Rule(State.EXTRA_POINT_2, 'RSP', WIN, effect=score_two_point_conversion),
+    Rule(State.EXTRA_POINT_2, 'RSP', LOSS, effect=end_pat),
+    Rule(State.EXTRA_POINT_2, 'RSP', TIE, effect=end_pat),
+]
+
+RULE_TABLE = statemachine.compile_rules(RULES)
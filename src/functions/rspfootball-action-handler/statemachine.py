@@ -0,0 +1,173 @@
+import copy
+from typing import Any, Callable, NamedTuple, Optional
+
+from rspmodel import State
+from rsputil import get_opponent
+
+# Declarative transitions of the game state machine
+#
+# A Rule describes what happens when an action with a given outcome is taken in
+# a given state. The outcome is the choice of a choice action, the play of a
+# CALL_PLAY action, the result of an RSP relative to the team in possession, or
+# the sum of the dice of a roll. A rule for a roll can give a range of sums.
+# Rules are compiled into a table keyed by (state, outcome), and applied by
+# apply_rule.
+#
+# An effect declares the states, and the other effects, that it can move the
+# game to, so that every transition of the rules can be enumerated.
+
+# RSP outcomes, relative to the team in possession
+WIN = 'WIN'
+LOSS = 'LOSS'
+TIE = 'TIE'
+
+# Players a rule can give actions to
+OFFENSE = 'OFFENSE' # the team in possession
+DEFENSE = 'DEFENSE' # the opponent of the team in possession
+ACTOR = 'ACTOR' # the player that took the action
+OPPONENT = 'OPPONENT' # the opponent of the player that took the action
+BOTH = 'BOTH'
+
+class Rule(NamedTuple):
+    state: State
+    # the action name, used only to describe the rule
+    action: str
+    # None for an action with a single outcome
+    outcome: Any
+    # the state to move to, if the rule has no effect
+    target: Optional[State] = None
+    # the actions to give to each player, by role, if the rule has no effect
+    actions: dict[str, list[str]] = {}
+    # game attributes to set, before anything else
+    updates: dict[str, Any] = {}
+    # result types to add to the game, after the updates
+    results: list[type] = []
+    # a function of the game, declared with @effect, that completes the
+    # transition in place of target and actions, when the next state depends on
+    # more than the outcome
+    effect: Optional[Callable] = None
+
+    # the name of the state the rule moves to, or of its effect
+    def describe(self):
+        if self.effect is not None:
+            return _describe_effect(self.effect)
+        return self.target.value
+
+    # the outcomes the rule is compiled under
+    def outcomes(self):
+        if isinstance(self.outcome, range):
+            return list(self.outcome)
+        return [self.outcome]
+
+
+# Declare a function of the game as an effect, that can move the game to any of
+# the given states, or hand it to any of the given effects
+def effect(*targets):
+    def declare(function):
+        function.targets = targets
+        return function
+    return declare
+
+# the name of an effect in upper case, in the style of the choice states of
+# doc/statediagram.puml
+def _describe_effect(function):
+    return function.__name__.upper()
+
+def _describe_target(target):
+    if isinstance(target, State):
+        return target.value
+    return _describe_effect(target)
+
+def _describe_outcome(outcome):
+    if isinstance(outcome, range):
+        if len(outcome) == 1:
+            return str(outcome.start)
+        return f'{outcome.start}-{outcome.stop - 1}'
+    return str(getattr(outcome, 'value', outcome))
+
+
+def get_rsp_outcome(game, winner):
+    if winner is None:
+        return TIE
+    return WIN if winner == game.possession else LOSS
+
+def _get_players(game, player, role):
+    if role == OFFENSE:
+        return [game.possession]
+    if role == DEFENSE:
+        return [get_opponent(game.possession)]
+    if role == ACTOR:
+        return [player]
+    if role == OPPONENT:
+        return [get_opponent(player)]
+    if role == BOTH:
+        return ['home', 'away']
+    raise Exception(f'Unknown role: {role}')
+
+# apply the rule to the game, for an action taken by the given player
+def apply_rule(game, player, rule: Rule):
+    for name, value in rule.updates.items():
+        setattr(game, name, copy.copy(value))
+
+    if rule.results:
+        game.result += [result_type() for result_type in rule.results]
+
+    if rule.effect is not None:
+        rule.effect(game)
+        return
+
+    game.state = rule.target
+    for role, actions in rule.actions.items():
+        for target_player in _get_players(game, player, role):
+            game.actions[target_player] = list(actions)
+
+# Return a dict mapping each (state, outcome) to its rule
+# raise an exception if a rule is ambiguous, would not move the game anywhere,
+# or has an effect that does not declare its targets
+def compile_rules(rules: list[Rule]):
+    table = {}
+
+    for rule in rules:
+        if (rule.target is None) == (rule.effect is None):
+            raise Exception(f'Rule for {rule.outcome} in state {rule.state} must have exactly one of target and effect')
+        if rule.effect is not None and not hasattr(rule.effect, 'targets'):
+            raise Exception(f'Effect {rule.effect.__name__} of the rule for {rule.outcome} in state {rule.state} must be declared with @effect')
+
+        for outcome in rule.outcomes():
+            key = (rule.state, outcome)
+            if key in table:
+                raise Exception(f'Multiple rules for {outcome} in state {rule.state}')
+            table[key] = rule
+
+    return table
+
+# Return the effects of the rules, and every effect they can hand the game to,
+# in the order they are first reached
+def get_effects(rules: list[Rule]):
+    effects = []
+    pending = [rule.effect for rule in rules if rule.effect is not None]
+    while pending:
+        function = pending.pop(0)
+        if function in effects:
+            continue
+        effects.append(function)
+        pending += [target for target in function.targets if not isinstance(target, State)]
+    return effects
+
+# Return the transitions of the rules, and of their effects, as PlantUML, in the
+# form used by doc/statediagram.puml, with each effect as a choice state
+def get_plantuml_transitions(rules: list[Rule]):
+    effects = get_effects(rules)
+    lines = [f'state {_describe_effect(function)} <<choice>>' for function in effects]
+
+    for rule in rules:
+        label = rule.action
+        if rule.outcome is not None:
+            label += f'\\n{_describe_outcome(rule.outcome)}'
+        lines.append(f'{rule.state.value} --> {rule.describe()}: {label}')
+
+    for function in effects:
+        for target in function.targets:
+            lines.append(f'{_describe_effect(function)} --> {_describe_target(target)}')
+
+    return lines
@@ -0,0 +1,20 @@
+import rspnotify
+import rspstore
+import rsputil
+
+# Consumer of the games table stream, that publishes the version of every
+# stored game to the notifier, so that pollers in any container are woken by
+# writes from any other
+# The stream must include new images
+
+def lambda_handler(event, context):
+    rsputil.configure_logger()
+
+    notifier = rspnotify.get_notifier()
+
+    for record in event.get('Records', []):
+        if record.get('eventName') not in ('INSERT', 'MODIFY'):
+            continue
+
+        image = rspstore.deserialize_item(record['dynamodb']['NewImage'])
+        notifier.publish(image['gameId'], int(image['version']))
@@ -1,13 +1,12 @@
 import os
 import json
 
-import boto3
-from boto3.dynamodb.conditions import Attr
-
+import rsppush
 import rsputil
 
 def lambda_handler(event, context):
-    
+    rsputil.configure_logger()
+
     body = rsputil.get_event_body(event)
 
     try:
@@ -27,18 +26,11 @@ class GameFullException(Exception):
     pass
 
 def join_game(game_id, user):
-    dynamodb = boto3.resource('dynamodb')
-
-    table = dynamodb.Table('rspfootball-games')
-
     try:
-        table.update_item(
-            Key = {"gameId": game_id},
-            UpdateExpression = 'SET players.away = :user, version = version + :1',
-            ConditionExpression = Attr('players.away').attribute_type('NULL') & Attr('players.home').ne(user),
-            ExpressionAttributeValues = {':user': user, ':1': 1},
-        )
-    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException as e:
+        version = rsputil.join_game(game_id, user)
+    except rsputil.ConditionalCheckFailedException as e:
         raise GameFullException(e)
 
-
+    # the body is only read if there is anywhere to push it
+    if rsppush.is_active():
+        rsppush.broadcast(game_id, rsputil.get_game_body(game_id, version))
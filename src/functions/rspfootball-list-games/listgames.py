@@ -1,15 +1,15 @@
-import functools
-
-import boto3
-from boto3.dynamodb.conditions import Attr
 import pydantic
 
 import rspmodel
+import rspstore
 import rsputil
 
 # This api is exposed to search for games
 # If no query parameters are supplied, a list of all available games is returned
+# Results are paged: each response holds at most limit games, and a cursor to
+# pass back to get the next page, which is null on the last page
 def lambda_handler(event, context):
+    rsputil.configure_logger()
 
     try:
         query = rspmodel.ListGamesQuery(**rsputil.get_event_query_params(event))
@@ -19,46 +19,17 @@ def lambda_handler(event, context):
     if (not query.available) and (not query.user):
         return rsputil.api_success({
             'games': [],
+            'cursor': None,
             'message': 'The provided query requests no results'
         })
 
-    filters = []
-    
-    if query.available:
-        filters.append(Attr('players.away').eq(None))
-    
-    if query.user:
-        filters.append(Attr('players.home').eq(query.user) | Attr('players.away').eq(query.user))
-
-    filter = functools.reduce(lambda a, b: a | b, filters)
-    games = get_games(filter)
-
-    # if query.user:
+    try:
+        games, cursor = rsputil.list_games(query.available, query.user, query.limit, query.cursor)
+    except rspstore.InvalidCursorException as error:
+        return rsputil.api_client_error(str(error))
 
-    #     games = get_games(
-    #         FilterExpression = ':user IN (players.home, players.away)',
-    #         ExpressionAttributeValues  = {':user': query.user}
-    #     )
-    # else:
-    #     games = get_games(
-    #         FilterExpression = 'players.away = :null',
-    #         ExpressionAttributeValues = {':null': None}
-    #     )
-    
     return rsputil.api_success({
-        'games': games
+        'games': games,
+        'cursor': cursor
     })
 
-
-def get_games(FilterExpression):
-    dynamodb = boto3.resource('dynamodb')
-
-    table = dynamodb.Table('rspfootball-games')
-
-    result = table.scan(
-        ProjectionExpression = 'gameId,players.home,players.away',
-        FilterExpression = FilterExpression
-    )
-
-    return result['Items']
-    
\ No newline at end of file
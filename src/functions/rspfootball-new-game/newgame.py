@@ -1,14 +1,12 @@
 import os
 import json
 
-import boto3
-from boto3.dynamodb.conditions import Attr
-
 import rsputil
 from rspmodel import Game, Play, Player, State
 
 def lambda_handler(event, context):
-    
+    rsputil.configure_logger()
+
     body = rsputil.get_event_body(event)
 
     try:
@@ -22,17 +20,13 @@ def lambda_handler(event, context):
 
     try:
         
-        if os.environ['ALLOW_OVERWRITES'] == 'true':
-            condition = None
-        else:
-            condition = Attr('gameId').not_exists()
-        
-        rsputil.store_game(game, condition)
+        create = os.environ['ALLOW_OVERWRITES'] != 'true'
+        body = rsputil.store_game(game, create=create)
 
     except rsputil.ConditionalCheckFailedException:
         return rsputil.api_client_error('Invalid gameId: game with id already exists')
     
-    return rsputil.api_success(game.dict())
+    return rsputil.api_json_success(body)
 
 
 def new_game(game_id):    
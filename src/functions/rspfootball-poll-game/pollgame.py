@@ -1,11 +1,20 @@
+import logging
 import os
 import time
 
-import boto3
-
+import rsplog
+import rsppoll
 import rsputil
 
+logger = logging.getLogger(__name__)
+
+# reads of the version by the polls of this container, compared with polling at
+# the fixed POLL_INTERVAL
+POLL_STATS = rsppoll.PollStats(fixed_interval=float(os.environ.get('POLL_INTERVAL', '0.5')))
+
 def lambda_handler(event, context):
+    rsputil.configure_logger()
+
     body = rsputil.get_event_body(event)
     
     if body is None:
@@ -14,22 +23,46 @@ def lambda_handler(event, context):
     try:
         game_id = body['gameId']
         client_version = body['version']
+        patch = body.get('patch', False)
     except KeyError as e:
         return rsputil.api_client_error(f'Missing required attribute: {e}')
 
     max_poll_time = float(os.environ['MAX_POLL_TIME'])
-    poll_interval = float(os.environ['POLL_INTERVAL'])
 
-    stop_time = time.time() + max_poll_time
+    # wait on the version alone, and only read the full game once it is known
+    # which version to return
+    version = rsputil.get_game_version(game_id)
+    if version is None:
+        return rsputil.api_client_error('Game not found')
+
+    reads = 1
+    start = time.monotonic()
+    if client_version >= version:
+        # the state is only known if the game is cached, otherwise the default
+        # schedule is used rather than reading the game
+        schedule = rsppoll.get_schedule(rsputil.GAME_CACHE.get_state(game_id, version))
+        version, waits = rsputil.wait_for_version(game_id, version, max_poll_time, schedule.intervals())
+        reads += waits
 
-    game = rsputil.get_game(game_id)
-    if game is None:
+    POLL_STATS.record(reads, time.monotonic() - start, changed = version is not None and version > client_version)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info('polled game', extra=rsplog.fields(
+            gameId = game_id,
+            version = version,
+            reads = reads,
+            polls = POLL_STATS.stats()))
+
+    body = rsputil.get_game_body(game_id, version)
+    if body is None:
         return rsputil.api_client_error('Game not found')
 
-    while (time.time() < stop_time) and (client_version >= game.version):
-        time.sleep(poll_interval)
-        game = rsputil.get_game(game_id)
+    # a client that asks for a patch is sent the changes since its version,
+    # when they are known and smaller than the game
+    # the versions are only known if this container stored or read them, so a
+    # client must always accept a full game in place of a patch
+    if patch:
+        body = rsputil.get_patch_body(game_id, client_version, version, body)
 
-    return rsputil.api_success(game.dict())
+    return rsputil.api_json_success(body)
 
     
\ No newline at end of file
@@ -0,0 +1,24 @@
+import rsppush
+import rsputil
+
+# $connect route of the WebSocket api
+# the game to follow is given by the gameId query parameter, and the user by
+# the optional user parameter; a connection without a user, or whose user is
+# not a player of the game, is a spectator
+
+def lambda_handler(event, context):
+    rsputil.configure_logger()
+
+    connection_id = event['requestContext']['connectionId']
+    query_params = rsputil.get_event_query_params(event) or {}
+
+    try:
+        game_id = query_params['gameId']
+    except KeyError as e:
+        return rsputil.api_client_error(f'Missing required attribute: {e}')
+
+    if rsputil.get_game_version(game_id) is None:
+        return rsputil.api_client_error('Game not found')
+
+    rsppush.get_registry().add(connection_id, game_id, query_params.get('user'))
+    return rsputil.api_success('Connected')
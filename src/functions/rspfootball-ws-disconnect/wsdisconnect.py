@@ -0,0 +1,10 @@
+import rsppush
+import rsputil
+
+# $disconnect route of the WebSocket api
+
+def lambda_handler(event, context):
+    rsputil.configure_logger()
+
+    rsppush.get_registry().remove(event['requestContext']['connectionId'])
+    return rsputil.api_success('Disconnected')
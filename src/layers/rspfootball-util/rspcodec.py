@@ -0,0 +1,143 @@
+import json
+import zlib
+from enum import Enum
+from typing import get_args
+
+from rspmodel import Game, Play, Player, Result, RspChoice, State
+
+# Compact binary encoding of a Game
+# The game is packed into a list of values, with every enum replaced by its
+# index in the enum, and every result replaced by a list of the index of its
+# type followed by its field values. The list is written as compact json and
+# compressed. The first byte of the encoding is the codec version.
+#
+# The codes are positional, so new enum members and result types must only
+# ever be appended, and CODEC_VERSION must be bumped for any other change
+#
+# Versions:
+#   1: the fields of Game up to result
+#   2: resultLog is appended, as a list of [version, results]. Version 1
+#     encodings are still read, with an empty resultLog
+
+CODEC_VERSION = 2
+COMPRESSION_LEVEL = 6
+
+PLAYERS = list(Player)
+RESULT_TYPES = list(get_args(Result))
+RESULT_CODES = {result_type: code for code, result_type in enumerate(RESULT_TYPES)}
+
+def _is_enum(field_type):
+    return isinstance(field_type, type) and issubclass(field_type, Enum)
+
+# for each result type, the list of (field name, enum type or None) of its fields
+RESULT_FIELDS = {
+    result_type: [(name, field.type_ if _is_enum(field.type_) else None)
+        for name, field in result_type.__fields__.items() if name != 'name']
+    for result_type in RESULT_TYPES
+}
+
+# for every coded enum, the list of its members, and the code of each member
+ENUM_MEMBERS = {enum_type: list(enum_type) for enum_type in [State, Play, Player, RspChoice] + [
+    enum_type for fields in RESULT_FIELDS.values() for _, enum_type in fields if enum_type]}
+ENUM_CODES = {enum_type: {member: code for code, member in enumerate(members)}
+    for enum_type, members in ENUM_MEMBERS.items()}
+
+class CodecException(Exception):
+    pass
+
+
+# handlers may assign plain strings to enum fields, so values are converted
+# to the enum type before they are coded
+def _encode_enum(enum_type, value):
+    if value is None:
+        return None
+    return ENUM_CODES[enum_type][enum_type(value)]
+
+def _decode_enum(enum_type, code):
+    if code is None:
+        return None
+    return ENUM_MEMBERS[enum_type][code]
+
+def _encode_result(result):
+    encoded = [RESULT_CODES[type(result)]]
+    for name, enum_type in RESULT_FIELDS[type(result)]:
+        value = getattr(result, name)
+        encoded.append(_encode_enum(enum_type, value) if enum_type else value)
+    return encoded
+
+def _decode_result(encoded):
+    code, *values = encoded
+    result_type = RESULT_TYPES[code]
+    result = {'name': result_type.__fields__['name'].default}
+    for (name, enum_type), value in zip(RESULT_FIELDS[result_type], values):
+        result[name] = _decode_enum(enum_type, value) if enum_type else value
+    return result
+
+def _encode_players(players, value_encoder=lambda value: value):
+    return [value_encoder(players[player]) for player in PLAYERS]
+
+def _decode_players(values, value_decoder=lambda value: value):
+    return {player: value_decoder(value) for player, value in zip(PLAYERS, values)}
+
+
+# Return the binary encoding of the game
+def pack_game(game: Game) -> bytes:
+    packed = [
+        game.gameId,
+        game.version,
+        _encode_players(game.players),
+        _encode_enum(State, game.state),
+        _encode_enum(Play, game.play),
+        _encode_enum(Player, game.possession),
+        game.ballpos,
+        game.firstDown,
+        game.playCount,
+        game.down,
+        _encode_enum(Player, game.firstKick),
+        _encode_players(game.rsp, lambda choice: _encode_enum(RspChoice, choice)),
+        game.roll,
+        _encode_players(game.score),
+        _encode_players(game.penalties),
+        _encode_players(game.actions),
+        [_encode_result(result) for result in game.result],
+        [[entry.version, [_encode_result(result) for result in entry.result]] for entry in game.resultLog],
+    ]
+
+    data = json.dumps(packed, separators=(',', ':')).encode()
+    return bytes([CODEC_VERSION]) + zlib.compress(data, COMPRESSION_LEVEL)
+
+# Return the fields of a game, as a dict in the form of Game.dict(), from its binary encoding
+def unpack_game(data: bytes) -> dict:
+    if not data or data[0] not in (1, CODEC_VERSION):
+        raise CodecException(f'Unsupported game encoding version: {data[:1]}')
+
+    packed = json.loads(zlib.decompress(data[1:]))
+    if data[0] == 1:
+        packed.append([])
+
+    (gameId, version, players, state, play, possession, ballpos, firstDown, playCount,
+        down, firstKick, rsp, roll, score, penalties, actions, result, resultLog) = packed
+
+    return {
+        'gameId': gameId,
+        'version': version,
+        'players': _decode_players(players),
+        'state': _decode_enum(State, state),
+        'play': _decode_enum(Play, play),
+        'possession': _decode_enum(Player, possession),
+        'ballpos': ballpos,
+        'firstDown': firstDown,
+        'playCount': playCount,
+        'down': down,
+        'firstKick': _decode_enum(Player, firstKick),
+        'rsp': _decode_players(rsp, lambda choice: _decode_enum(RspChoice, choice)),
+        'roll': roll,
+        'score': _decode_players(score),
+        'penalties': _decode_players(penalties),
+        'actions': _decode_players(actions),
+        'result': [_decode_result(encoded) for encoded in result],
+        'resultLog': [{
+            'version': entry_version,
+            'result': [_decode_result(encoded) for encoded in entry_result],
+        } for entry_version, entry_result in resultLog],
+    }
@@ -0,0 +1,51 @@
+import json
+import logging
+import os
+
+# Logging for the lambdas
+# Records are written as one json object per line, so that they can be queried
+# in CloudWatch. Structured fields are passed with extra=fields(...), and
+# messages should use lazy %-style arguments rather than f-strings, so that
+# nothing is formatted for records of a disabled level.
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+# return the extra argument of a logging call, that adds the given fields to the record
+def fields(**kwargs):
+    return {'fields': kwargs}
+
+
+_configured = False
+
+# Configure the root logger from the LOG_LEVEL environment variable
+# Only the first call in a container has any effect
+# The lambda runtime installs its own handler on the root logger, so rather
+# than adding a handler, the json formatter is set on the existing handlers
+def configure_logger():
+    global _configured
+    if _configured:
+        return
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, os.environ['LOG_LEVEL'].upper()))
+
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler())
+
+    for handler in root.handlers:
+        handler.setFormatter(JsonFormatter())
+
+    _configured = True
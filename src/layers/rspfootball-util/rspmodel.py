@@ -1,6 +1,6 @@
 from enum import Enum
-from typing import Literal, Optional, Union
-from pydantic import BaseModel
+from typing import Annotated, Any, Literal, Optional, Union, get_args
+from pydantic import BaseModel, Field, PrivateAttr, conint
 
 class Player(str, Enum):
     home = 'home'
@@ -127,6 +127,8 @@ class FakeKickChoiceAction(BaseModel):
     choice: FakeKickChoice
 
 Action = Union[RspAction, RollAction, KickoffElectionAction, KickoffChoiceAction, CallPlayAction, TouchbackChoiceAction, RollAgainChoiceAction, PatChoiceAction, SackChoiceAction, FakeKickChoiceAction]
+# An Action field is parsed by its name, rather than by trying every type of the union
+TaggedAction = Annotated[Action, Field(discriminator='name')]
 
 class TurnoverType(str, Enum):
     DOWNS = 'DOWNS'
@@ -196,6 +198,19 @@ class KickoffElectionResult(BaseModel):
     choice: KickoffElectionChoice
 
 Result = Union[RspResult, RollResult, ScoreResult, GainResult, LossResult, TurnoverResult, OutOfBoundsPassResult, OutOfBoundsKickResult, TouchbackResult, IncompletePassResult, CoffinCornerResult, FakeKickResult, BlockedKickResult, KickoffElectionResult]
+# A Result field is parsed by its name, rather than by trying every type of the union
+TaggedResult = Annotated[Result, Field(discriminator='name')]
+
+# The results of the action that produced a version of a game
+class ResultLogEntry(BaseModel):
+    version: int
+    result: list[TaggedResult]
+
+# resultLog holds at least the results of every version of the game in the
+# last RESULT_LOG_VERSIONS versions, oldest first, so that a client that is a
+# few versions behind gets every result it missed from the current game
+# versions without results have no entry
+RESULT_LOG_VERSIONS = 8
 
 class Game(BaseModel):
     gameId: str
@@ -214,14 +229,131 @@ class Game(BaseModel):
     score: dict[Player, int]
     penalties: dict[Player, int]
     actions: dict[Player, list[str]]
-    result: list[Result]
+    result: list[TaggedResult]
+    resultLog: list[ResultLogEntry] = []
+
+    # the field values as of the last load or store, see mark_clean
+    _clean: Optional[dict] = PrivateAttr(default=None)
+
+    # record the current field values as the stored state of this game
+    # get_changes reports the fields that are modified after this call
+    # fields is the result of self.dict(), if the caller already has it
+    def mark_clean(self, fields=None):
+        self._clean = self.dict() if fields is None else fields
+
+    # return True if mark_clean has been called, so that get_changes reports
+    # the changes since the game was loaded or stored
+    def is_marked_clean(self):
+        return self._clean is not None
+
+    # return a dict mapping the path of every value changed since the last
+    # call to mark_clean, to its new value
+    # paths are tuples: a top level field is (field,), and a changed key of a
+    # dict field is (field, key) so that other keys of the dict are not rewritten
+    # return None if mark_clean was never called
+    # fields is the result of self.dict(), if the caller already has it
+    def get_changes(self, fields=None) -> Optional[dict[tuple, Any]]:
+        if self._clean is None:
+            return None
+
+        changes = {}
+        for field, value in (self.dict() if fields is None else fields).items():
+            clean = self._clean[field]
+            if value == clean:
+                continue
+
+            if type(value) is dict and type(clean) is dict and value.keys() == clean.keys():
+                for key, item in value.items():
+                    if item != clean[key]:
+                        changes[(field, getattr(key, 'value', key))] = item
+            else:
+                changes[(field,)] = value
+
+        return changes
+
+# Version of the layout of stored games
+# Stored items are tagged with the version they were written with, and only
+# items tagged with the current version are loaded by construct_game. It must
+# be bumped for any change to Game or the results that old items would not
+# satisfy without validation, such as a new field without a default
+SCHEMA_VERSION = 2
+
+RESULT_TYPES_BY_NAME = {result_type.__fields__['name'].default: result_type for result_type in get_args(Result)}
+
+# for each result type, the enum type of each of its enum fields
+RESULT_ENUM_FIELDS = {
+    result_type: {name: field.type_ for name, field in result_type.__fields__.items()
+        if isinstance(field.type_, type) and issubclass(field.type_, Enum)}
+    for result_type in RESULT_TYPES_BY_NAME.values()
+}
+
+def _member(enum_type, value):
+    return None if value is None else enum_type(value)
+
+def _by_player(values, convert=None):
+    if convert is None:
+        return {Player(player): value for player, value in values.items()}
+    return {Player(player): convert(value) for player, value in values.items()}
+
+def _construct_result(result):
+    result_type = RESULT_TYPES_BY_NAME[result['name']]
+    enum_fields = RESULT_ENUM_FIELDS[result_type]
+    return result_type.construct(**{name: enum_fields[name](value) if name in enum_fields else value
+        for name, value in result.items()})
+
+# Return the Game of the given fields, without validation
+# Only for fields that were produced by Game.dict() of a valid game, such as
+# a stored item tagged with SCHEMA_VERSION. The values are not checked, but
+# enums and results are converted to the types that validation would give, so
+# the game is equal to Game(**fields). Untrusted input must be validated with Game(**fields)
+def construct_game(fields) -> Game:
+    return Game.construct(
+        gameId = fields['gameId'],
+        version = fields['version'],
+        players = _by_player(fields['players']),
+        state = State(fields['state']),
+        play = _member(Play, fields['play']),
+        possession = _member(Player, fields['possession']),
+        ballpos = fields['ballpos'],
+        firstDown = fields['firstDown'],
+        playCount = fields['playCount'],
+        down = fields['down'],
+        firstKick = _member(Player, fields['firstKick']),
+        rsp = _by_player(fields['rsp'], lambda choice: _member(RspChoice, choice)),
+        roll = list(fields['roll']),
+        score = _by_player(fields['score']),
+        penalties = _by_player(fields['penalties']),
+        actions = _by_player(fields['actions'], list),
+        result = [_construct_result(result) for result in fields['result']],
+        resultLog = [ResultLogEntry.construct(
+            version = entry['version'],
+            result = [_construct_result(result) for result in entry['result']],
+        ) for entry in fields['resultLog']],
+    )
+
+# A record of the action that produced a version of a game
+# changes maps the dotted path of every changed value of the game to its new value
+class ActionLogEntry(BaseModel):
+    gameId: str
+    version: int
+    player: Optional[Player]
+    action: Optional[TaggedAction]
+    roll: list[int]
+    result: list[TaggedResult]
+    changes: dict[str, Any]
 
+# a client that sends the version of the game it holds, and sets patch, may
+# be answered with a patch from that version, see rsppatch
 class ActionRequest(BaseModel):
     gameId: str
     user: str
-    action: Action
+    action: TaggedAction
+    version: Optional[int]
+    patch: bool = False
 
 class ListGamesQuery(BaseModel):
     available: bool = True
     user: Optional[str]
+    limit: conint(ge=1, le=100) = 25
+    cursor: Optional[str]
 
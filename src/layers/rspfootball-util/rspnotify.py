@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Notification of new game versions, so that pollers can wait for a change
+# instead of reading the game version at a fixed interval
+#
+# Every store of a game publishes its new version, and a poller waits until a
+# version after its own is published, or until its timeout. Notifications are
+# best effort: a poller always reads the version from the store before it
+# returns, so a lost notification costs latency, never correctness.
+#
+# Notifiers, selected by the NOTIFIER environment variable:
+#   none: nothing is published, and wait only sleeps, so pollers read the
+#     version at every interval, as they did before notifications
+#   local: in process, for locallambda, tests and single process hosting
+#   socket: a NotifyServer hub at NOTIFY_ADDRESS (host:port), shared by every
+#     process that stores or polls games. In AWS, the rspfootball-game-stream
+#     function publishes the versions of the games table stream to the hub, so
+#     that writes from any container are seen
+
+class Notifier:
+    # True if every stored version is published to this notifier, so that a
+    # waiter does not need to read the version until it is notified or times out
+    complete = False
+
+    def publish(self, game_id, version):
+        raise NotImplementedError()
+
+    # Block until a version of the game after after_version is published, or
+    # until timeout seconds have passed
+    # Return the published version, or None on timeout
+    def wait(self, game_id, after_version, timeout) -> Optional[int]:
+        raise NotImplementedError()
+
+
+class NoNotifier(Notifier):
+
+    def publish(self, game_id, version):
+        pass
+
+    def wait(self, game_id, after_version, timeout) -> Optional[int]:
+        time.sleep(max(timeout, 0))
+        return None
+
+
+class LocalNotifier(Notifier):
+    # Only the latest published version of each game is kept, for at most
+    # max_games games, so a waiter that starts after a publish still sees it
+    complete = True
+
+    def __init__(self, max_games=1024):
+        self.max_games = max_games
+        self._versions: dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def publish(self, game_id, version):
+        with self._condition:
+            if version <= self._versions.get(game_id, -1):
+                return
+
+            self._versions.pop(game_id, None)
+            self._versions[game_id] = version
+            while len(self._versions) > self.max_games:
+                del self._versions[next(iter(self._versions))]
+
+            self._condition.notify_all()
+
+    def wait(self, game_id, after_version, timeout) -> Optional[int]:
+        with self._condition:
+            notified = self._condition.wait_for(lambda: self._versions.get(game_id, -1) > after_version, max(timeout, 0))
+            return self._versions[game_id] if notified else None
+
+
+class SocketNotifier(Notifier):
+    # Client of a NotifyServer
+    # Each request is one json line on a new connection
+    complete = True
+
+    # time allowed to connect to the hub and send a request
+    CONNECT_TIMEOUT = 1.0
+
+    def __init__(self, address):
+        self.address = address
+
+    def publish(self, game_id, version):
+        try:
+            with socket.create_connection(self.address, timeout=self.CONNECT_TIMEOUT) as connection:
+                connection.sendall(encode_message({'op': 'publish', 'gameId': game_id, 'version': version}))
+        except OSError as e:
+            logger.warning('failed to publish version %s of game %s: %s', version, game_id, e)
+
+    def wait(self, game_id, after_version, timeout) -> Optional[int]:
+        timeout = max(timeout, 0)
+        stop_time = time.monotonic() + timeout
+        try:
+            with socket.create_connection(self.address, timeout=self.CONNECT_TIMEOUT) as connection:
+                connection.sendall(encode_message({'op': 'wait', 'gameId': game_id, 'version': after_version, 'timeout': timeout}))
+                connection.settimeout(timeout + self.CONNECT_TIMEOUT)
+                line = connection.makefile('rb').readline()
+        except OSError as e:
+            logger.warning('failed to wait for game %s: %s', game_id, e)
+            # the hub is down, so wait as if there were no notifications
+            time.sleep(max(stop_time - time.monotonic(), 0))
+            return None
+
+        if not line:
+            return None
+        return json.loads(line).get('version')
+
+
+# encode a message as one json line, the framing of the socket notifier and pusher
+def encode_message(message):
+    return (json.dumps(message) + '\n').encode()
+
+class _NotifyRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            message = json.loads(line)
+            if message['op'] == 'publish':
+                self.server.notifier.publish(message['gameId'], message['version'])
+            elif message['op'] == 'wait':
+                version = self.server.notifier.wait(message['gameId'], message['version'], message['timeout'])
+                self.wfile.write(encode_message({'version': version}))
+        except (ValueError, KeyError) as e:
+            logger.warning('bad notify request: %s', e)
+
+class NotifyServer(socketserver.ThreadingTCPServer):
+    # Hub that relays published versions to waiters in other processes
+    # Every waiter holds a thread and a connection for the length of its wait
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _NotifyRequestHandler)
+        self.notifier = LocalNotifier()
+
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+NOTIFIERS = {
+    'none': lambda: NoNotifier(),
+    'local': lambda: LocalNotifier(),
+    'socket': lambda: SocketNotifier(parse_address(os.environ['NOTIFY_ADDRESS'])),
+}
+
+_notifier = None
+
+# Return the Notifier selected by the NOTIFIER environment variable
+# The notifier is created once per container, and defaults to none
+def get_notifier() -> Notifier:
+    global _notifier
+    if _notifier is None:
+        name = os.environ.get('NOTIFIER', 'none')
+        if name not in NOTIFIERS:
+            raise Exception(f'Unknown NOTIFIER: {name}')
+        _notifier = NOTIFIERS[name]()
+    return _notifier
+
+# forget the current notifier, so the next get_notifier reads the environment again
+def reset_notifier():
+    global _notifier
+    _notifier = None
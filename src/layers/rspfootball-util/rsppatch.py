@@ -0,0 +1,79 @@
+import copy
+
+# Patches between versions of a game, for clients that already hold a version
+# A patch is a json object:
+#   gameId: the id of the game
+#   baseVersion: the version the patch applies to
+#   version: the version the patch produces
+#   set: the changed values, keyed by dotted path, as returned by get_changes.
+#     Dicts are compared key by key, and any other value, including a list,
+#     is replaced whole
+#   unset: the dotted paths of removed keys
+# A response body with a baseVersion is a patch, and any other is a full game.
+# Patches are best effort, and a full game can be sent to a client that asked
+# for a patch, whenever the server does not hold the client's version.
+#
+# apply_patch is the reference implementation for clients.
+
+class PatchException(Exception):
+    pass
+
+# return True if the response body, as a dict, is a patch rather than a full game
+def is_patch(body):
+    return 'baseVersion' in body
+
+# return the patch that turns the fields of one version of a game into those of another
+def make_patch(base, fields):
+    changes = {}
+    removed = []
+    _diff(base, fields, '', changes, removed)
+
+    patch = {
+        'gameId': fields['gameId'],
+        'baseVersion': base['version'],
+        'version': fields['version'],
+        'set': changes,
+    }
+    if removed:
+        patch['unset'] = removed
+    return patch
+
+def _diff(base, fields, prefix, changes, removed):
+    for key, value in fields.items():
+        path = prefix + key
+        if key not in base:
+            changes[path] = value
+        elif isinstance(value, dict) and isinstance(base[key], dict):
+            _diff(base[key], value, path + '.', changes, removed)
+        elif value != base[key]:
+            changes[path] = value
+
+    for key in base:
+        if key not in fields:
+            removed.append(prefix + key)
+
+# return the fields of the game after applying the patch to the given fields,
+# which are not modified
+# raise PatchException if the patch is for another game or version
+def apply_patch(fields, patch):
+    if fields['gameId'] != patch['gameId'] or fields['version'] != patch['baseVersion']:
+        raise PatchException(f"Patch of {patch['gameId']} version {patch['baseVersion']} does not apply to {fields['gameId']} version {fields['version']}")
+
+    fields = copy.deepcopy(fields)
+    for path, value in patch['set'].items():
+        parent, key = _resolve(fields, path)
+        parent[key] = copy.deepcopy(value)
+
+    for path in patch.get('unset', []):
+        parent, key = _resolve(fields, path)
+        parent.pop(key, None)
+
+    fields['version'] = patch['version']
+    return fields
+
+# return the dict that holds the last key of the path, and that key
+def _resolve(fields, path):
+    *parents, key = path.split('.')
+    for name in parents:
+        fields = fields.setdefault(name, {})
+    return fields, key
@@ -0,0 +1,122 @@
+import math
+import threading
+
+from rspmodel import State
+
+# Adaptive schedule for reading the game version while a poll waits
+# A poll usually starts right after the client's own action, when the
+# opponent's answer is most likely, so the version is read quickly at first,
+# and the interval grows geometrically up to a cap while nothing changes.
+# How fast it starts and where it stops depends on what the opponent has to do:
+# an RSP or a roll is a single click, while a play call or a choice is thought
+# about.
+
+class PollSchedule:
+
+    def __init__(self, initial, factor, max_interval):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+
+    # yield the delay before each read of the version, forever
+    def intervals(self):
+        interval = self.initial
+        while True:
+            yield interval
+            interval = min(interval * self.factor, self.max_interval)
+
+    def __repr__(self):
+        return f'PollSchedule({self.initial}, {self.factor}, {self.max_interval})'
+
+
+# states in which both players answer with an RSP
+RSP_STATES = {
+    State.COIN_TOSS,
+    State.SHORT_RUN,
+    State.LONG_RUN,
+    State.SHORT_PASS,
+    State.LONG_PASS,
+    State.BOMB,
+    State.PUNT,
+    State.FUMBLE,
+    State.EXTRA_POINT_2,
+}
+
+# states in which a player makes a choice, or calls a play
+CHOICE_STATES = {
+    State.KICKOFF_ELECTION,
+    State.KICKOFF_CHOICE,
+    State.KICK_RETURN_1,
+    State.TOUCHBACK_CHOICE,
+    State.PLAY_CALL,
+    State.BOMB_CHOICE,
+    State.FAKE_PUNT_CHOICE,
+    State.SACK_CHOICE,
+    State.PICK_TOUCHBACK_CHOICE,
+    State.PAT_CHOICE,
+}
+
+RSP_SCHEDULE = PollSchedule(initial=0.05, factor=2, max_interval=0.4)
+CHOICE_SCHEDULE = PollSchedule(initial=0.2, factor=2, max_interval=2.0)
+GAME_OVER_SCHEDULE = PollSchedule(initial=2.0, factor=2, max_interval=5.0)
+
+# the schedule of the states that are not listed, which are rolls
+DEFAULT_SCHEDULE = PollSchedule(initial=0.1, factor=2, max_interval=0.8)
+
+POLL_SCHEDULES = {
+    **{state: RSP_SCHEDULE for state in RSP_STATES},
+    **{state: CHOICE_SCHEDULE for state in CHOICE_STATES},
+    State.GAME_OVER: GAME_OVER_SCHEDULE,
+}
+
+# return the schedule for a game in the given state, or the default schedule
+# if the state is not known
+def get_schedule(state) -> PollSchedule:
+    return POLL_SCHEDULES.get(state, DEFAULT_SCHEDULE)
+
+
+class PollStats:
+    # Counters of the version reads made by polls in this container
+    # Each poll also counts the reads that the fixed schedule, which read the
+    # version every fixed_interval, would have made in the time the poll
+    # waited, so the two can be compared. That count is an estimate: the
+    # adaptive schedule may see a change later than it happened, which makes
+    # the wait, and the estimate, longer than the fixed schedule would have.
+
+    def __init__(self, fixed_interval):
+        self.fixed_interval = fixed_interval
+        self._lock = threading.Lock()
+        self.clear()
+
+    # record a poll that made the given number of version reads, and waited for
+    # the given number of seconds; changed is True if the poll returned a newer
+    # version than the client had
+    def record(self, reads, waited, changed):
+        fixed_reads = 1 + (math.ceil(waited / self.fixed_interval) if waited > 0 else 0)
+        with self._lock:
+            self.polls += 1
+            self.changes += 1 if changed else 0
+            self.reads += reads
+            self.fixed_reads += fixed_reads
+            self.waited += waited
+
+    def clear(self):
+        with self._lock:
+            self.polls = 0
+            self.changes = 0
+            self.reads = 0
+            self.fixed_reads = 0
+            self.waited = 0.0
+
+    # reads_per_change and fixed_reads_per_change are None until a poll returns a change
+    def stats(self):
+        with self._lock:
+            return {
+                'polls': self.polls,
+                'changes': self.changes,
+                'reads': self.reads,
+                'fixedReads': self.fixed_reads,
+                'readsPerChange': self.reads / self.changes if self.changes else None,
+                'fixedReadsPerChange': self.fixed_reads / self.changes if self.changes else None,
+                'waited': self.waited,
+            }
@@ -0,0 +1,347 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+
+import boto3
+from botocore.config import Config
+
+import rspstore
+from rspnotify import encode_message, parse_address
+
+logger = logging.getLogger(__name__)
+
+# Push of game updates to clients over WebSockets
+# Clients, both players and spectators, open a WebSocket connection for a game.
+# The connection is recorded in a registry by the rspfootball-ws-connect
+# function, and removed by rspfootball-ws-disconnect. After a game is stored,
+# the action handler and joingame broadcast the json body of the game, the same
+# body that pollgame returns, to every connection of the game. The poll
+# endpoint stays available, for clients that can not keep a connection open.
+#
+# Pushers, selected by the PUSHER environment variable:
+#   none: nothing is pushed
+#   apigateway: the connections of the registry are sent the game through the
+#     API Gateway management api at PUSH_ENDPOINT
+#   socket: a PushServer at PUSH_ADDRESS (host:port), the local stand-in for
+#     the API Gateway WebSocket api, for offline runs and tests
+#
+# Pushes are best effort: a failed broadcast is logged, and never fails the
+# request that stored the game.
+
+CONNECTIONS_TABLE = 'rspfootball-connections'
+
+# Secondary index of the connections table, with the partition key gameId,
+# that projects connectionId
+GAME_CONNECTIONS_INDEX = 'game-connections-index'
+
+# API Gateway closes a WebSocket connection after 2 hours, so a connection
+# whose disconnect was missed expires from the table after that, by its ttl
+CONNECTION_TTL = 2 * 60 * 60
+
+# Client configuration of the API Gateway management api. The action handler
+# broadcasts before it answers, so a slow endpoint is given up on quickly
+# rather than retried with the default 60s timeouts
+PUSH_CONFIG = Config(
+    connect_timeout = 1,
+    read_timeout = 2,
+    retries = {
+        'max_attempts': 2,
+        'mode': 'standard',
+    },
+)
+
+# seconds a broadcast may spend sending to connections, after which the
+# remaining connections are skipped, and get the game from their next poll
+BROADCAST_TIMEOUT = float(os.environ.get('PUSH_BROADCAST_TIMEOUT', '2'))
+
+class GoneConnectionException(Exception):
+    pass
+
+
+class ConnectionRegistry:
+    # The open WebSocket connections of each game
+    # user is None for a spectator that has not given a name
+
+    def add(self, connection_id, game_id, user=None):
+        raise NotImplementedError()
+
+    def remove(self, connection_id):
+        raise NotImplementedError()
+
+    # Return the ids of the connections of the game
+    def get_connections(self, game_id) -> list[str]:
+        raise NotImplementedError()
+
+
+class DynamoConnectionRegistry(ConnectionRegistry):
+    # The client is created lazily, once per container, as for the game stores
+
+    def __init__(self, table_name=CONNECTIONS_TABLE):
+        self.table_name = table_name
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client('dynamodb', config=rspstore.DYNAMODB_CONFIG)
+        return self._client
+
+    def add(self, connection_id, game_id, user=None):
+        item = {
+            'connectionId': {'S': connection_id},
+            'gameId': {'S': game_id},
+            'ttl': {'N': str(int(time.time()) + CONNECTION_TTL)},
+        }
+        if user is not None:
+            item['user'] = {'S': user}
+
+        self.client.put_item(TableName = self.table_name, Item = item)
+
+    def remove(self, connection_id):
+        self.client.delete_item(
+            TableName = self.table_name,
+            Key = {'connectionId': {'S': connection_id}},
+        )
+
+    def get_connections(self, game_id) -> list[str]:
+        kwargs = {
+            'TableName': self.table_name,
+            'IndexName': GAME_CONNECTIONS_INDEX,
+            'KeyConditionExpression': 'gameId = :id',
+            'ExpressionAttributeValues': {':id': {'S': game_id}},
+            'ProjectionExpression': 'connectionId',
+        }
+
+        connections = []
+        while True:
+            response = self.client.query(**kwargs)
+            connections.extend(item['connectionId']['S'] for item in response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return connections
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+class MemoryConnectionRegistry(ConnectionRegistry):
+
+    def __init__(self):
+        self._games: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, connection_id, game_id, user=None):
+        with self._lock:
+            self._games[connection_id] = game_id
+
+    def remove(self, connection_id):
+        with self._lock:
+            self._games.pop(connection_id, None)
+
+    def get_connections(self, game_id) -> list[str]:
+        with self._lock:
+            return [connection_id for connection_id, game in self._games.items() if game == game_id]
+
+
+class Pusher:
+    # False if broadcasts are dropped, so that callers can skip building the body
+    active = True
+
+    # Send the json body of the game to every connection of the game
+    def broadcast(self, game_id, body):
+        raise NotImplementedError()
+
+
+class NoPusher(Pusher):
+    active = False
+
+    def broadcast(self, game_id, body):
+        pass
+
+
+class ApiGatewayPusher(Pusher):
+    # Connections that API Gateway reports as gone are removed from the registry
+    # Connections are sent the game one after another, for at most timeout seconds
+
+    def __init__(self, endpoint, registry: ConnectionRegistry = None, timeout=BROADCAST_TIMEOUT):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._registry = registry
+        self._client = None
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            self._registry = get_registry()
+        return self._registry
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client('apigatewaymanagementapi', endpoint_url=self.endpoint, config=PUSH_CONFIG)
+        return self._client
+
+    def broadcast(self, game_id, body):
+        data = body.encode()
+        stop_time = time.monotonic() + self.timeout
+        connections = self.registry.get_connections(game_id)
+        for sent, connection_id in enumerate(connections):
+            if time.monotonic() > stop_time:
+                logger.warning('broadcast of game %s timed out, skipped %s of %s connections', game_id, len(connections) - sent, len(connections))
+                return
+            try:
+                self.send(connection_id, data)
+            except GoneConnectionException:
+                self.registry.remove(connection_id)
+
+    def send(self, connection_id, data):
+        try:
+            self.client.post_to_connection(ConnectionId = connection_id, Data = data)
+        except self.client.exceptions.GoneException as e:
+            raise GoneConnectionException(e)
+
+
+class SocketPusher(Pusher):
+    # Client of a PushServer
+    # Each broadcast is one json line on a new connection
+
+    CONNECT_TIMEOUT = 1.0
+
+    def __init__(self, address):
+        self.address = address
+
+    def broadcast(self, game_id, body):
+        with socket.create_connection(self.address, timeout=self.CONNECT_TIMEOUT) as connection:
+            connection.sendall(encode_message({'op': 'broadcast', 'gameId': game_id, 'body': body}))
+
+
+class _PushRequestHandler(socketserver.StreamRequestHandler):
+    # The first line of a connection is either a broadcast from a lambda, or the
+    # connect request of a client, {"op": "connect", "gameId": ..., "user": ...}
+    # A client is answered with its connectionId, then sent one line with the
+    # body of the game for every broadcast, until it closes the connection
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            message = json.loads(line)
+            op = message['op']
+            if op == 'broadcast':
+                self.server.broadcast(message['gameId'], message['body'])
+            elif op == 'connect':
+                self.handle_client(message['gameId'], message.get('user'))
+        except (ValueError, KeyError) as e:
+            logger.warning('bad push request: %s', e)
+
+    def handle_client(self, game_id, user):
+        connection_id = self.server.connect(self, game_id, user)
+        try:
+            self.send(json.dumps({'connectionId': connection_id}))
+            # a client sends nothing more, so the end of its input is its disconnect
+            while self.rfile.readline():
+                pass
+        except OSError:
+            pass
+        finally:
+            self.server.disconnect(connection_id)
+
+    def send(self, line):
+        self.wfile.write((line + '\n').encode())
+        self.wfile.flush()
+
+class PushServer(socketserver.ThreadingTCPServer):
+    # Local stand-in for the API Gateway WebSocket api and the connection
+    # registry, that holds the connections of clients and relays broadcasts to
+    # them. Lambdas that store games reach it through SocketPusher.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _PushRequestHandler)
+        self.registry = MemoryConnectionRegistry()
+        self._clients: dict[str, _PushRequestHandler] = {}
+        self._lock = threading.Lock()
+
+    def connect(self, client, game_id, user):
+        connection_id = uuid.uuid4().hex
+        with self._lock:
+            self._clients[connection_id] = client
+        self.registry.add(connection_id, game_id, user)
+        return connection_id
+
+    def disconnect(self, connection_id):
+        self.registry.remove(connection_id)
+        with self._lock:
+            self._clients.pop(connection_id, None)
+
+    def broadcast(self, game_id, body):
+        for connection_id in self.registry.get_connections(game_id):
+            with self._lock:
+                client = self._clients.get(connection_id)
+            if client is None:
+                continue
+
+            try:
+                client.send(body)
+            except OSError:
+                self.disconnect(connection_id)
+
+
+CONNECTION_REGISTRIES = {
+    'dynamodb': lambda: DynamoConnectionRegistry(),
+    'memory': lambda: MemoryConnectionRegistry(),
+}
+
+PUSHERS = {
+    'none': lambda: NoPusher(),
+    'apigateway': lambda: ApiGatewayPusher(os.environ['PUSH_ENDPOINT']),
+    'socket': lambda: SocketPusher(parse_address(os.environ['PUSH_ADDRESS'])),
+}
+
+_registry = None
+_pusher = None
+
+# Return the ConnectionRegistry selected by the CONNECTION_STORE environment variable
+# The registry is created once per container, and defaults to dynamodb
+def get_registry() -> ConnectionRegistry:
+    global _registry
+    if _registry is None:
+        name = os.environ.get('CONNECTION_STORE', 'dynamodb')
+        if name not in CONNECTION_REGISTRIES:
+            raise Exception(f'Unknown CONNECTION_STORE: {name}')
+        _registry = CONNECTION_REGISTRIES[name]()
+    return _registry
+
+# Return the Pusher selected by the PUSHER environment variable
+# The pusher is created once per container, and defaults to none
+def get_pusher() -> Pusher:
+    global _pusher
+    if _pusher is None:
+        name = os.environ.get('PUSHER', 'none')
+        if name not in PUSHERS:
+            raise Exception(f'Unknown PUSHER: {name}')
+        _pusher = PUSHERS[name]()
+    return _pusher
+
+# forget the current registry and pusher, so the next calls read the environment again
+def reset_push():
+    global _registry, _pusher
+    _registry = None
+    _pusher = None
+
+# return True if broadcasts are sent anywhere
+def is_active():
+    return get_pusher().active
+
+# send the json body of the game to every connection of the game
+# errors are logged, and not raised
+def broadcast(game_id, body):
+    try:
+        get_pusher().broadcast(game_id, body)
+    except Exception as e:
+        logger.warning('failed to push game %s: %s', game_id, e)
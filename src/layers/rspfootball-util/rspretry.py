@@ -0,0 +1,67 @@
+import os
+import random
+import time
+
+from botocore.exceptions import ClientError
+
+# Retry policy for optimistic updates of a game
+# An update that loses a version race, or is throttled, is retried after a
+# random delay of up to base_delay * 2^n seconds, capped at max_delay ("full
+# jitter"), so that two players acting at the same moment do not retry in
+# lockstep. Retries stop after max_attempts, or once the next attempt could not
+# start before the deadline.
+
+# error codes of DynamoDB throttling, that are worth retrying after a delay
+THROTTLING_ERRORS = {
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException',
+}
+
+# time left for the lambda to write its response after the last attempt
+DEADLINE_MARGIN = 1.0
+
+# return True if the exception is a throttling error from DynamoDB
+def is_throttling(exception):
+    return isinstance(exception, ClientError) and exception.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+# Return the monotonic time by which the lambda with the given context must
+# stop retrying, or None if there is no context, such as when run locally
+def get_deadline(context, margin=DEADLINE_MARGIN):
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - margin
+
+class RetryPolicy:
+
+    def __init__(self, max_attempts, base_delay, max_delay, deadline=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    # the policy of the MAX_UPDATE_ATTEMPTS, RETRY_BASE_DELAY and RETRY_MAX_DELAY
+    # environment variables, with the deadline of the lambda context
+    @classmethod
+    def from_env(cls, context=None):
+        return cls(
+            max_attempts = int(os.environ['MAX_UPDATE_ATTEMPTS']),
+            base_delay = float(os.environ.get('RETRY_BASE_DELAY', '0.02')),
+            max_delay = float(os.environ.get('RETRY_MAX_DELAY', '0.5')),
+            deadline = get_deadline(context),
+        )
+
+    # return the delay before the retry that follows the given number of failed attempts
+    def get_delay(self, failures):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (failures - 1)))
+
+    # yield the number of each attempt, starting at 1, sleeping before every retry
+    # the caller stops iterating once an attempt succeeds
+    def attempts(self):
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                delay = self.get_delay(attempt - 1)
+                if self.deadline is not None and time.monotonic() + delay >= self.deadline:
+                    return
+                time.sleep(delay)
+            yield attempt
@@ -0,0 +1,46 @@
+from rspmodel import Game
+
+# Mutable state of a game, for the action handlers
+# Handlers make many small writes to a game, and on a pydantic model each one
+# goes through BaseModel.__setattr__. A GameState holds the same fields in
+# slots, so handlers work on plain attributes, and the game is converted only
+# when it is loaded or stored.
+#
+# The fields keep the types of the Game fields, including the enum members of
+# state, play and possession, so that handlers and the rule table compare them
+# the same way for both.
+
+GAME_FIELDS = tuple(Game.__fields__)
+
+class GameState:
+    __slots__ = GAME_FIELDS
+
+    def __init__(self, **fields):
+        for name in GAME_FIELDS:
+            setattr(self, name, fields[name])
+
+    # Return the state of the given game
+    # the state shares the dicts and lists of the game, so the game must not be
+    # used again other than as the argument of to_game
+    @classmethod
+    def from_game(cls, game: Game):
+        state = cls.__new__(cls)
+        for name in GAME_FIELDS:
+            setattr(state, name, getattr(game, name))
+        return state
+
+    # Return a Game with the fields of this state, without validation
+    # if a game is given, the private attributes of the game, such as the
+    # values used by get_changes, are kept
+    def to_game(self, game: Game = None) -> Game:
+        values = {name: getattr(self, name) for name in GAME_FIELDS}
+        if game is None:
+            return Game.construct(**values)
+        return game.copy(update=values)
+
+    def dict(self):
+        return self.to_game().dict()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in GAME_FIELDS)
+        return f'GameState({fields})'
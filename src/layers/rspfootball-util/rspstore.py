@@ -0,0 +1,860 @@
+import base64
+import decimal
+import json
+import os
+import threading
+from typing import Any, Optional
+
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
+
+from rspmodel import SCHEMA_VERSION, ActionLogEntry, Game, construct_game
+import rspcodec
+
+GAMES_TABLE = 'rspfootball-games'
+ACTION_LOG_TABLE = 'rspfootball-game-actions'
+
+# Formats of stored game items
+# dict: the attributes of the item are the fields of Game.dict()
+# binary: the game is packed by rspcodec into the data attribute. gameId,
+#   version and players are also stored as attributes, for keys, conditions
+#   and filters, and take precedence over the packed values
+# Secondary indexes of the games table, used by list_games
+# Every game item carries the partition keys of these indexes, which are kept
+# in sync with players by every write that sets players:
+#   open-games-index: openGame, only set while the game has no away player, so
+#     that the index is sparse and only holds games that can be joined
+#   home-user-index: homeUser, the home player
+#   away-user-index: awayUser, the away player, only set once a player joins
+# Each index projects the players attribute, and only the players attribute,
+# so filters on an index query can only test players
+OPEN_GAMES_INDEX = 'open-games-index'
+HOME_USER_INDEX = 'home-user-index'
+AWAY_USER_INDEX = 'away-user-index'
+OPEN_GAME = 'OPEN'
+
+DICT_FORMAT = 'dict'
+BINARY_FORMAT = 'binary'
+STORAGE_FORMATS = [DICT_FORMAT, BINARY_FORMAT]
+
+# Client configuration shared by every lambda in the layer. Timeouts are kept
+# well below the lambda timeouts so that a hung connection is retried instead
+# of consuming the rest of the invocation
+# max_pool_connections is per client, not per container: the dynamodb stores
+# write through the resource and read through a separate low level client, and
+# the connection registry of rsppush has a client of its own, so a container
+# keeps up to one pool for each of them
+DYNAMODB_CONFIG = Config(
+    max_pool_connections = 10,
+    connect_timeout = 2,
+    read_timeout = 5,
+    tcp_keepalive = True,
+    retries = {
+        'max_attempts': 3,
+        'mode': 'standard',
+    },
+)
+
+class ConditionalCheckFailedException(Exception):
+    # game is the stored game at the time of the failure, marked clean, if the
+    # store returned it, so that the caller can retry without reading it again
+    def __init__(self, *args, game: Optional[Game] = None):
+        super().__init__(*args)
+        self.game = game
+
+class InvalidCursorException(Exception):
+    pass
+
+# A list_games cursor is an opaque, url safe string, that records the query it
+# belongs to and the position to resume from
+def encode_cursor(available, user, position):
+    cursor = json.dumps({'available': available, 'user': user, 'position': position}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+# return the position recorded in the cursor
+# raise InvalidCursorException if the cursor is malformed, or belongs to a different query
+def decode_cursor(cursor, available, user):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if decoded['available'] != available or decoded['user'] != user:
+            raise InvalidCursorException('Cursor does not belong to this query')
+        return decoded['position']
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorException(f'Malformed cursor: {e}')
+
+
+# Deserializers for low level dynamodb attribute values, by type
+# Every number stored in our tables is an integer, so numbers are read as int,
+# rather than as the Decimal that the boto3 resource api returns
+ATTRIBUTE_DESERIALIZERS = {
+    'S': lambda value: value,
+    'N': lambda value: int(value) if '.' not in value and 'e' not in value.lower() else decimal.Decimal(value),
+    'BOOL': lambda value: value,
+    'NULL': lambda value: None,
+    'B': lambda value: value,
+    'M': lambda value: {key: deserialize_attribute(item) for key, item in value.items()},
+    'L': lambda value: [deserialize_attribute(item) for item in value],
+    'SS': set,
+    'NS': lambda value: {ATTRIBUTE_DESERIALIZERS['N'](item) for item in value},
+    'BS': set,
+}
+
+# return the python value of a low level attribute value, such as {'N': '5'}
+def deserialize_attribute(attribute):
+    [(attribute_type, value)] = attribute.items()
+    return ATTRIBUTE_DESERIALIZERS[attribute_type](value)
+
+# return the python form of a low level item
+def deserialize_item(item):
+    return {key: deserialize_attribute(value) for key, value in item.items()}
+
+
+class GameStore:
+    # Storage backend for games
+    # Every write that is given a condition must apply atomically, and raise
+    # ConditionalCheckFailedException when the condition does not hold
+
+    # Return the game with the given id, or None if it does not exist
+    # The returned game is marked clean, so that store_game can write only its
+    # changes, unless the stored item has to be rewritten in full
+    def get_game(self, game_id) -> Optional[Game]:
+        raise NotImplementedError()
+
+    # Return only the version of the game with the given id, or None if it does not exist
+    # This is much cheaper than get_game, and is meant for polling for changes
+    def get_game_version(self, game_id) -> Optional[int]:
+        raise NotImplementedError()
+
+    # Store the given game
+    # If expected_version is given, the write only succeeds if the stored game has that version
+    # If create is True, the write only succeeds if no game with the same id is stored
+    # player and action describe the action that produced this version of the
+    # game, for stores that keep an action log
+    # fields is the result of game.dict(), if the caller already has it, so
+    # that the game is only serialized once per store
+    def store_game(self, game: Game, expected_version=None, create=False, player=None, action=None, fields=None):
+        raise NotImplementedError()
+
+    # Set the away player of the game to the given user, and increment the version
+    # The write only succeeds if the game exists, has no away player, and the
+    # home player is not the given user
+    # Return the new version of the game
+    def join_game(self, game_id, user) -> int:
+        raise NotImplementedError()
+
+    # Return True if the store implements submit_rsp
+    def supports_submit_rsp(self):
+        return False
+
+    # Store the first RSP of an exchange, without a version condition
+    # game is the game after the RSP action of the given player was handled,
+    # with the choice in rsp[player] and the opponent's slot empty. Only
+    # rsp[player], actions and result are written, and the version is
+    # incremented, so concurrent first throws do not need to agree on a version
+    # The write only succeeds if the stored game is in the given state, both rsp
+    # slots are empty, and the player may RSP. Otherwise, such as when the
+    # opponent threw first, ConditionalCheckFailedException is raised
+    # Return the stored game after the write, marked clean. It differs from game
+    # in its version, and in any field another writer changed since game was read
+    def submit_rsp(self, game: Game, player, action, state) -> Game:
+        raise NotImplementedError()
+
+    # Return a page of at most limit {'gameId', 'players'} dicts for the games
+    # that are either available to join (if available is True) or include the
+    # given user, and a cursor for the next page, or None if this is the last page
+    # Each game is listed once across all pages
+    # raise InvalidCursorException if the cursor is not from a previous page of the same query
+    def list_games(self, available, user, limit, cursor=None):
+        raise NotImplementedError()
+
+    # Return the ActionLogEntry of every version of the game after since_version, in order
+    # Only supported by stores that keep an action log
+    def get_action_log(self, game_id, since_version=0) -> list[ActionLogEntry]:
+        raise NotImplementedError()
+
+
+# Return the changes of the game since it was marked clean, keyed by dotted path
+# roll and result are left out, since every log entry records them in full
+# if the game was never marked clean, every field is reported as changed
+def get_log_changes(game: Game, fields=None) -> dict[str, Any]:
+    if fields is None:
+        fields = game.dict()
+
+    changes = game.get_changes(fields)
+    if changes is None:
+        changes = {(field,): value for field, value in fields.items()}
+
+    return {'.'.join(path): value for path, value in changes.items() if path[0] not in ('roll', 'result')}
+
+def make_log_entry(game: Game, player=None, action=None, fields=None) -> ActionLogEntry:
+    return ActionLogEntry(
+        gameId = game.gameId,
+        version = game.version,
+        player = player,
+        action = action,
+        roll = game.roll,
+        result = game.result,
+        changes = get_log_changes(game, fields),
+    )
+
+# apply a log entry, as a dict, to a game item, as a dict, in place
+def apply_log_entry(item, entry):
+    for path, value in entry['changes'].items():
+        *parents, key = path.split('.')
+        target = item
+        for parent in parents:
+            target = target[parent]
+        target[key] = value
+
+    item['version'] = entry['version']
+    item['roll'] = entry['roll']
+    item['result'] = entry['result']
+
+
+# Return the Game of the fields of a stored item
+# items tagged with the current schema version were written by store_game from
+# a valid game, so they are trusted and constructed without validation
+def load_game(fields) -> Game:
+    if fields.get('schemaVersion') == SCHEMA_VERSION:
+        return construct_game(fields)
+    return Game(**fields)
+
+# Return the index attributes of a game item with the given players
+# attributes with a value of None must be absent from the item
+def get_index_attributes(players):
+    return {
+        'openGame': OPEN_GAME if players['away'] is None else None,
+        'homeUser': players['home'],
+        'awayUser': players['away'],
+    }
+
+
+class DynamoGameStore(GameStore):
+    # The dynamodb resource and games table are created lazily, once per
+    # container, so that warm invocations reuse the resource model, the resolved
+    # endpoint and the keep-alive connections in the pool
+
+    # Items of either storage format are read. New items are written in the
+    # given format, by default the STORAGE_FORMAT environment variable
+    def __init__(self, table_name=GAMES_TABLE, storage_format=None):
+        self.table_name = table_name
+        if storage_format is None:
+            storage_format = os.environ.get('STORAGE_FORMAT', DICT_FORMAT)
+        if storage_format not in STORAGE_FORMATS:
+            raise Exception(f'Unknown STORAGE_FORMAT: {storage_format}')
+        self.storage_format = storage_format
+        self._dynamodb = None
+        self._table = None
+        self._client = None
+
+    @property
+    def dynamodb(self):
+        if self._dynamodb is None:
+            self._dynamodb = boto3.resource('dynamodb', config=DYNAMODB_CONFIG)
+        return self._dynamodb
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = self.dynamodb.Table(self.table_name)
+        return self._table
+
+    # Reads go through a plain low level client and deserialize_item, so that
+    # the item is decoded to ints in one pass, instead of to Decimals by the
+    # resource api and then converted again
+    # The client of the resource can not be used, since the resource registers
+    # its (de)serialization on it, so the store holds two connection pools
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client('dynamodb', config=DYNAMODB_CONFIG)
+        return self._client
+
+    def get_game(self, game_id) -> Optional[Game]:
+        item = self._get_item(game_id)
+        if item is None:
+            return None
+
+        return self._load_game(item)
+
+    def get_game_version(self, game_id) -> Optional[int]:
+        item = self._get_item(
+            game_id,
+            ProjectionExpression = '#v',
+            ExpressionAttributeNames = {'#v': 'version'},
+        )
+
+        if item is None:
+            return None
+
+        return item['version']
+
+    # return the deserialized item of the game, or None if it does not exist
+    def _get_item(self, game_id, **kwargs):
+        response = self.client.get_item(
+            TableName = self.table_name,
+            Key = {'gameId': {'S': game_id}},
+            **kwargs,
+        )
+
+        if 'Item' not in response:
+            return None
+
+        return deserialize_item(response['Item'])
+
+    # A versioned write of a game that was loaded from the store only sets the
+    # changed paths with UpdateItem, rather than rewriting the whole item
+    def store_game(self, game: Game, expected_version=None, create=False, player=None, action=None, fields=None):
+        if fields is None:
+            fields = game.dict()
+        changes = game.get_changes(fields)
+
+        if create:
+            self._put_item(self._game_item(game, fields), Attr('gameId').not_exists())
+        elif expected_version is not None and changes and self.storage_format == DICT_FORMAT:
+            if any(path[0] == 'players' for path in changes):
+                changes.update({(name,): value for name, value in get_index_attributes(game.players).items()})
+            self._update_item(game.gameId, changes, Attr('version').eq(expected_version))
+        elif expected_version is not None:
+            self._put_item(self._game_item(game, fields), Attr('version').eq(expected_version))
+        else:
+            self._put_item(self._game_item(game, fields), None)
+
+        game.mark_clean(fields)
+
+    # return the item to store for the game, in the storage format of this store
+    # fields is the result of game.dict()
+    def _game_item(self, game: Game, fields):
+        if self.storage_format == BINARY_FORMAT:
+            item = {
+                'gameId': game.gameId,
+                'version': game.version,
+                'players': {
+                    'home': game.players['home'],
+                    'away': game.players['away'],
+                },
+                'data': rspcodec.pack_game(game),
+            }
+        else:
+            item = dict(fields)
+
+        item['schemaVersion'] = SCHEMA_VERSION
+        for name, value in get_index_attributes(game.players).items():
+            if value is not None:
+                item[name] = value
+        return item
+
+    # return the fields of the game, as a dict, from a stored item of either format
+    def _item_fields(self, item):
+        if 'data' not in item:
+            return item
+
+        fields = rspcodec.unpack_game(bytes(item['data']))
+        fields['version'] = item['version']
+        fields['players'] = item['players']
+        fields['schemaVersion'] = item.get('schemaVersion')
+        return fields
+
+    def _load_game(self, item) -> Game:
+        fields = self._item_fields(item)
+        game = load_game(fields)
+
+        # paths can only be updated in a dict item, so a binary item read by a
+        # dict format store is not marked clean, and is rewritten in full
+        # an item that is not tagged with the current schema version is also
+        # rewritten in full, so that it is tagged, since an update by path
+        # would not write the fields that validation filled in
+        if fields.get('schemaVersion') == SCHEMA_VERSION and (self.storage_format == BINARY_FORMAT or 'data' not in item):
+            game.mark_clean()
+        return game
+
+    def _put_item(self, item, condition):
+        try:
+            if condition is None:
+                self.table.put_item(Item = item)
+            else:
+                self.table.put_item(
+                    Item = item,
+                    ConditionExpression = condition,
+                    ReturnValuesOnConditionCheckFailure = 'ALL_OLD',
+                )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            raise self._condition_failure(e)
+
+    # return the ConditionalCheckFailedException for a failed conditional write
+    # that asked for the stored item, with the stored game
+    # the item of the error is not deserialized by the resource, so it is read
+    # with deserialize_item, like the items of the low level client
+    def _condition_failure(self, error):
+        item = error.response.get('Item')
+        game = None if item is None else self._load_game(deserialize_item(item))
+        return ConditionalCheckFailedException(error, game=game)
+
+    # set only the given paths of the item, and remove top level attributes
+    # whose new value is None and are not game fields, such as index attributes
+    # placeholders use the #f and :u prefixes, so they do not collide with the
+    # #n and :v placeholders that boto3 generates for the condition
+    def _update_item(self, game_id, changes, condition):
+        names = {}
+        values = {}
+        assignments = []
+        removals = []
+
+        for path, value in changes.items():
+            placeholders = []
+            for part in path:
+                if part not in names:
+                    names[part] = f'#f{len(names)}'
+                placeholders.append(names[part])
+
+            if value is None and len(path) == 1 and path[0] not in Game.__fields__:
+                removals.append(placeholders[0])
+                continue
+
+            value_placeholder = f':u{len(values)}'
+            values[value_placeholder] = value
+            assignments.append(f"{'.'.join(placeholders)} = {value_placeholder}")
+
+        update = 'SET ' + ', '.join(assignments)
+        if removals:
+            update += ' REMOVE ' + ', '.join(removals)
+
+        try:
+            self.table.update_item(
+                Key = {'gameId': game_id},
+                UpdateExpression = update,
+                ConditionExpression = condition,
+                ExpressionAttributeNames = {placeholder: name for name, placeholder in names.items()},
+                ExpressionAttributeValues = values,
+                ReturnValuesOnConditionCheckFailure = 'ALL_OLD',
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            raise self._condition_failure(e)
+
+    def join_game(self, game_id, user) -> int:
+        try:
+            response = self.table.update_item(
+                Key = {"gameId": game_id},
+                UpdateExpression = 'SET players.away = :user, awayUser = :user, version = version + :1 REMOVE openGame',
+                ConditionExpression = Attr('players.away').attribute_type('NULL') & Attr('players.home').ne(user),
+                ExpressionAttributeValues = {':user': user, ':1': 1},
+                ReturnValues = 'UPDATED_NEW',
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            raise ConditionalCheckFailedException(e)
+
+        return int(response['Attributes']['version'])
+
+    # only a dict item can be updated by path
+    def supports_submit_rsp(self):
+        return self.storage_format == DICT_FORMAT
+
+    def submit_rsp(self, game: Game, player, action, state) -> Game:
+        opponent = 'away' if player == 'home' else 'home'
+        serializer = TypeSerializer()
+        values = {
+            ':choice': getattr(action.choice, 'value', action.choice),
+            ':player_actions': list(game.actions[player]),
+            ':opponent_actions': list(game.actions[opponent]),
+            ':result': [],
+            ':state': getattr(state, 'value', state),
+            ':null': 'NULL',
+            ':rsp': 'RSP',
+            ':1': 1,
+        }
+
+        try:
+            response = self.client.update_item(
+                TableName = self.table_name,
+                Key = {'gameId': {'S': game.gameId}},
+                UpdateExpression = 'SET #r.#p = :choice, #a.#p = :player_actions, #a.#o = :opponent_actions, #res = :result, #v = #v + :1',
+                ConditionExpression = '#s = :state AND attribute_type(#r.#p, :null) AND attribute_type(#r.#o, :null) AND contains(#a.#p, :rsp)',
+                ExpressionAttributeNames = {'#r': 'rsp', '#a': 'actions', '#res': 'result', '#v': 'version', '#s': 'state', '#p': player, '#o': opponent},
+                ExpressionAttributeValues = {name: serializer.serialize(value) for name, value in values.items()},
+                ReturnValues = 'ALL_NEW',
+                ReturnValuesOnConditionCheckFailure = 'ALL_OLD',
+            )
+        except self.client.exceptions.ConditionalCheckFailedException as e:
+            raise self._condition_failure(e)
+
+        return self._load_game(deserialize_item(response['Attributes']))
+
+    # query the indexes rather than scanning the table, so that the cost of
+    # listing games grows with the number of results, not the size of the table
+    # Each index query reads at most the rest of the page, so the latency of a
+    # page is bounded by limit
+    def list_games(self, available, user, limit, cursor=None):
+        queries = []
+
+        if available:
+            queries.append((OPEN_GAMES_INDEX, 'openGame', OPEN_GAME, None))
+
+        if user:
+            # open games of the user were already listed by the open games query
+            # openGame is not projected, but a game is open exactly while its
+            # away player is null, so the open games are left out by players
+            home_filter = Attr('players.away').attribute_type('S') if available else None
+            queries.append((HOME_USER_INDEX, 'homeUser', user, home_filter))
+            queries.append((AWAY_USER_INDEX, 'awayUser', user, None))
+
+        # the position is the index of the current query, and the key to resume it from
+        source, start_key = 0, None
+        if cursor is not None:
+            source, start_key = self._check_position(decode_cursor(cursor, available, user), queries)
+
+        games = []
+        while source < len(queries) and len(games) < limit:
+            index, key, value, filter = queries[source]
+            items, start_key = self._query_index(index, key, value, filter, limit - len(games), start_key)
+            games += items
+
+            if start_key is None:
+                source += 1
+
+        if source >= len(queries):
+            return games, None
+        return games, encode_cursor(available, user, [source, start_key])
+
+    # return the index of the query and the key to resume it from, of a position
+    # decoded from a cursor
+    # raise InvalidCursorException unless the position is a pair of one of the
+    # queries, and either None or a key of the index of that query, which has a
+    # gameId, and only the index key of the query besides
+    def _check_position(self, position, queries):
+        if not isinstance(position, list) or len(position) != 2:
+            raise InvalidCursorException('Malformed cursor: position is not a pair')
+
+        source, start_key = position
+        if type(source) is not int or not 0 <= source < len(queries):
+            raise InvalidCursorException(f'Malformed cursor: no query {source!r}')
+
+        _, key, value, _ = queries[source]
+        if start_key is not None and not (isinstance(start_key, dict) and isinstance(start_key.get('gameId'), str)
+                and start_key.keys() <= {'gameId', key} and start_key.get(key, value) == value):
+            raise InvalidCursorException('Malformed cursor: start key is not a key of the query')
+
+        return source, start_key
+
+    # return a page of at most limit {'gameId', 'players'} items from the index
+    # with the given key, and the key to read the next page from, or None
+    def _query_index(self, index, key, value, filter, limit, start_key):
+        query = {
+            'IndexName': index,
+            'KeyConditionExpression': Key(key).eq(value),
+            'ProjectionExpression': 'gameId,players.home,players.away',
+            'Limit': limit,
+        }
+        if filter is not None:
+            query['FilterExpression'] = filter
+        if start_key is not None:
+            query['ExclusiveStartKey'] = start_key
+
+        response = self.table.query(**query)
+        return response['Items'], response.get('LastEvaluatedKey')
+
+
+class MemoryGameStore(GameStore):
+    # Thread-safe, process local store
+    # Games are copied in and out of the store, so callers can never mutate stored state
+
+    def __init__(self):
+        self._games: dict[str, Game] = {}
+        self._logs: dict[str, list[ActionLogEntry]] = {}
+        self._lock = threading.Lock()
+
+    def get_game(self, game_id) -> Optional[Game]:
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is None:
+                return None
+            game = game.copy(deep=True)
+
+        game.mark_clean()
+        return game
+
+    def get_game_version(self, game_id) -> Optional[int]:
+        with self._lock:
+            game = self._games.get(game_id)
+            return None if game is None else game.version
+
+    def store_game(self, game: Game, expected_version=None, create=False, player=None, action=None, fields=None):
+        if fields is None:
+            fields = game.dict()
+        entry = make_log_entry(game, player, action, fields)
+
+        with self._lock:
+            stored = self._games.get(game.gameId)
+
+            if create and stored is not None:
+                raise ConditionalCheckFailedException(f'Game {game.gameId} already exists')
+
+            if expected_version is not None and (stored is None or stored.version != expected_version):
+                current = None if stored is None else stored.copy(deep=True)
+                if current is not None:
+                    current.mark_clean()
+                raise ConditionalCheckFailedException(f'Game {game.gameId} is not at version {expected_version}', game=current)
+
+            self._games[game.gameId] = game.copy(deep=True)
+
+            # an unversioned write starts a new history from this version
+            log = self._logs.setdefault(game.gameId, [])
+            if expected_version is None:
+                log[:] = [logged for logged in log if logged.version < game.version]
+            else:
+                log.append(entry)
+
+        game.mark_clean(fields)
+
+    def join_game(self, game_id, user) -> int:
+        with self._lock:
+            stored = self._games.get(game_id)
+
+            if stored is None or stored.players['away'] is not None or stored.players['home'] == user:
+                raise ConditionalCheckFailedException(f'Cannot join game {game_id}')
+
+            stored.players['away'] = user
+            stored.version += 1
+
+            self._logs.setdefault(game_id, []).append(ActionLogEntry(
+                gameId = game_id,
+                version = stored.version,
+                player = None,
+                action = None,
+                roll = stored.roll,
+                result = stored.result,
+                changes = {'players.away': user, 'version': stored.version},
+            ))
+            return stored.version
+
+    # games are listed in gameId order, and the cursor is the last listed gameId
+    def list_games(self, available, user, limit, cursor=None):
+        after = None
+        if cursor is not None:
+            after = decode_cursor(cursor, available, user)
+            if not isinstance(after, str):
+                raise InvalidCursorException('Malformed cursor: position is not a gameId')
+
+        with self._lock:
+            games = sorted(self._games.values(), key=lambda game: game.gameId)
+
+        def matches(game):
+            if after is not None and game.gameId <= after:
+                return False
+            if available and game.players['away'] is None:
+                return True
+            return bool(user) and user in (game.players['home'], game.players['away'])
+
+        games = [game for game in games if matches(game)]
+        page = [{
+            'gameId': game.gameId,
+            'players': {
+                'home': game.players['home'],
+                'away': game.players['away'],
+            }} for game in games[:limit]]
+
+        if len(games) <= limit:
+            return page, None
+        return page, encode_cursor(available, user, page[-1]['gameId'])
+
+    def supports_submit_rsp(self):
+        return True
+
+    def submit_rsp(self, game: Game, player, action, state) -> Game:
+        opponent = 'away' if player == 'home' else 'home'
+
+        with self._lock:
+            stored = self._games.get(game.gameId)
+
+            if (stored is None or stored.state != state or stored.rsp[player] is not None
+                    or stored.rsp[opponent] is not None or 'RSP' not in stored.actions[player]):
+                current = None if stored is None else stored.copy(deep=True)
+                if current is not None:
+                    current.mark_clean()
+                raise ConditionalCheckFailedException(f'Cannot submit RSP for {player} in game {game.gameId}', game=current)
+
+            stored.mark_clean()
+            stored.rsp[player] = action.choice
+            stored.actions[player] = list(game.actions[player])
+            stored.actions[opponent] = list(game.actions[opponent])
+            stored.result = []
+            stored.version += 1
+            self._logs.setdefault(game.gameId, []).append(make_log_entry(stored, player, action))
+            stored = stored.copy(deep=True)
+
+        stored.mark_clean()
+        return stored
+
+    def get_action_log(self, game_id, since_version=0) -> list[ActionLogEntry]:
+        with self._lock:
+            log = self._logs.get(game_id, [])
+            return [entry.copy(deep=True) for entry in log if entry.version > since_version]
+
+
+class EventLogGameStore(DynamoGameStore):
+    # Event sourced store
+    # Every versioned write appends an ActionLogEntry to the action log table,
+    # keyed by (gameId, version), instead of rewriting the game item. The games
+    # table holds a snapshot of each game, refreshed every snapshot_interval
+    # versions and whenever a player joins, so that list_games stays current.
+    # A game is rebuilt from its snapshot plus the log entries after it.
+
+    def __init__(self, table_name=GAMES_TABLE, log_table_name=ACTION_LOG_TABLE, snapshot_interval=None, storage_format=None):
+        super().__init__(table_name, storage_format)
+        self.log_table_name = log_table_name
+        if snapshot_interval is None:
+            snapshot_interval = int(os.environ.get('SNAPSHOT_INTERVAL', '10'))
+        self.snapshot_interval = snapshot_interval
+        self._log_table = None
+
+    @property
+    def log_table(self):
+        if self._log_table is None:
+            self._log_table = self.dynamodb.Table(self.log_table_name)
+        return self._log_table
+
+    def get_game(self, game_id) -> Optional[Game]:
+        item = self._get_item(game_id)
+        if item is None:
+            return None
+
+        item = self._item_fields(item)
+        for entry in self._query_log(game_id, item['version']):
+            apply_log_entry(item, entry)
+
+        game = load_game(item)
+        game.mark_clean()
+        return game
+
+    # the latest log entry always has the latest version, since snapshots
+    # are only stored for logged versions
+    # a game without log entries is at the version of its snapshot
+    def get_game_version(self, game_id) -> Optional[int]:
+        response = self.client.query(
+            TableName = self.log_table_name,
+            KeyConditionExpression = 'gameId = :id',
+            ProjectionExpression = '#v',
+            ExpressionAttributeNames = {'#v': 'version'},
+            ExpressionAttributeValues = {':id': {'S': game_id}},
+            ScanIndexForward = False,
+            Limit = 1,
+            ConsistentRead = True,
+        )
+
+        if response['Items']:
+            return deserialize_item(response['Items'][0])['version']
+
+        return super().get_game_version(game_id)
+
+    def store_game(self, game: Game, expected_version=None, create=False, player=None, action=None, fields=None):
+        if create or expected_version is None:
+            # the game is replaced, so its history starts over from this version
+            if not create:
+                self._truncate_log(game.gameId, game.version)
+            super().store_game(game, create=create, fields=fields)
+            return
+
+        if fields is None:
+            fields = game.dict()
+
+        if game.version != expected_version + 1:
+            raise Exception(f'Cannot log version {game.version} of game {game.gameId} after version {expected_version}')
+
+        entry = make_log_entry(game, player, action, fields)
+        try:
+            self.log_table.put_item(
+                Item = entry.dict(),
+                ConditionExpression = Attr('version').not_exists(),
+            )
+        except self.log_table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            raise ConditionalCheckFailedException(e)
+
+        if game.version % self.snapshot_interval == 0:
+            self._store_snapshot(game, fields)
+
+        game.mark_clean(fields)
+
+    def join_game(self, game_id, user) -> int:
+        game = self.get_game(game_id)
+
+        if game is None or game.players['away'] is not None or game.players['home'] == user:
+            raise ConditionalCheckFailedException(f'Cannot join game {game_id}')
+
+        version = game.version
+        game.players['away'] = user
+        game.version += 1
+
+        fields = game.dict()
+        self.store_game(game, expected_version=version, fields=fields)
+        self._store_snapshot(game, fields)
+        return game.version
+
+    # every version is appended to the log under a version condition, so a
+    # first RSP is stored like any other action
+    def supports_submit_rsp(self):
+        return False
+
+    def get_action_log(self, game_id, since_version=0) -> list[ActionLogEntry]:
+        return [ActionLogEntry(**entry) for entry in self._query_log(game_id, since_version)]
+
+    # store the game as its snapshot, unless a newer snapshot is already stored
+    def _store_snapshot(self, game: Game, fields):
+        try:
+            self.table.put_item(
+                Item = self._game_item(game, fields),
+                ConditionExpression = Attr('gameId').not_exists() | Attr('version').lt(game.version),
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+    # yield the log entries of the game after since_version, in order
+    def _query_log(self, game_id, since_version):
+        query = {
+            'TableName': self.log_table_name,
+            'KeyConditionExpression': 'gameId = :id AND #v > :since',
+            'ExpressionAttributeNames': {'#v': 'version'},
+            'ExpressionAttributeValues': {':id': {'S': game_id}, ':since': {'N': str(since_version)}},
+            'ConsistentRead': True,
+        }
+
+        while True:
+            response = self.client.query(**query)
+            for item in response['Items']:
+                yield deserialize_item(item)
+
+            if 'LastEvaluatedKey' not in response:
+                return
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    # delete the log entries of the game after the given version
+    def _truncate_log(self, game_id, version):
+        with self.log_table.batch_writer() as batch:
+            for entry in list(self._query_log(game_id, version)):
+                batch.delete_item(Key = {'gameId': game_id, 'version': entry['version']})
+
+
+GAME_STORES = {
+    'dynamodb': DynamoGameStore,
+    'memory': MemoryGameStore,
+    'eventlog': EventLogGameStore,
+}
+
+_store = None
+
+# Return the GameStore selected by the GAME_STORE environment variable
+# The store is created once per container, and defaults to dynamodb
+def get_store() -> GameStore:
+    global _store
+    if _store is None:
+        name = os.environ.get('GAME_STORE', 'dynamodb')
+        if name not in GAME_STORES:
+            raise Exception(f'Unknown GAME_STORE: {name}')
+        _store = GAME_STORES[name]()
+    return _store
+
+# drop the current store, so that the next call to get_store creates a new one
+# used by tests to start from an empty store, or to switch backends
+def reset_store():
+    global _store
+    _store = None
@@ -1,18 +1,22 @@
 import base64
-import decimal
 import json
-import logging
 import os
-
-import boto3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
 
 from rspmodel import Game, Player
+import rsplog
+import rspnotify
+import rsppatch
+import rspstore
+from rspstore import ConditionalCheckFailedException
 
 
+# configure json logging at LOG_LEVEL, once per container
 def configure_logger():
-    level = os.environ['LOG_LEVEL']
-    level = getattr(logging, level.upper())
-    logging.basicConfig(level=level)
+    rsplog.configure_logger()
 
 
 def get_event_body(event):
@@ -46,69 +50,352 @@ def get_event_query_params(event):
     
     return None
 
-def api_response(status, body):
-    return {
+def api_response(status, body, headers=None):
+    return api_json_response(status, json.dumps(body), headers)
+
+# body is already serialized as json
+def api_json_response(status, body, headers=None):
+    response = {
         'statusCode': status,
-        'body': json.dumps(body)
+        'body': body
     }
+    if headers:
+        response['headers'] = headers
+    return response
 
 def api_success(body):
     return api_response(200, body)
 
+def api_json_success(body, headers=None):
+    return api_json_response(200, body, headers)
+
 def api_client_error(body):
     return api_response(400, body)
 
 def api_server_fault(body):
     return api_response(500, body)
 
-def get_game(gameId) -> Game:
-    dynamodb = boto3.resource('dynamodb')
+class GameCache:
+    # Bounded LRU cache of parsed games, keyed by gameId
+    # Each entry holds the last game read or stored by this container, and its
+    # json response body once it has been serialized. An entry is only used
+    # while its version is the stored version, so the cache saves parsing and
+    # serializing the game, not the version check.
+    # Entries expire after ttl seconds, and the least recently used entry is
+    # evicted once there are more than max_size entries
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, Game, Optional[str]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # return the version of the cached game, or None if it is not cached
+    def get_version(self, gameId):
+        with self._lock:
+            entry = self._get_entry(gameId)
+            return None if entry is None else entry[1].version
+
+    # return the state of the cached game if it is at the given version, otherwise None
+    # does not count a hit or a miss
+    def get_state(self, gameId, version):
+        with self._lock:
+            entry = self._get_entry(gameId)
+            return None if entry is None or entry[1].version != version else entry[1].state
+
+    # return a copy of the cached game if it is at the given version, otherwise None
+    # counts a hit or a miss
+    def get(self, gameId, version) -> Game:
+        with self._lock:
+            entry = self._get_entry(gameId)
+            if entry is None or entry[1].version != version:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(gameId)
+        return entry[1].copy(deep=True)
+
+    # return the json body of the cached game if it is at the given version and
+    # has been serialized, otherwise None
+    # the same string is returned to every caller, so it is never copied
+    # counts a hit or a miss
+    def get_body(self, gameId, version) -> Optional[str]:
+        with self._lock:
+            entry = self._get_entry(gameId)
+            if entry is None or entry[1].version != version or entry[2] is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(gameId)
+            return entry[2]
+
+    # body is the json body of the game, if it has been serialized
+    def put(self, game: Game, body=None):
+        if self.max_size <= 0:
+            return
+
+        game = game.copy(deep=True)
+        with self._lock:
+            self._entries[game.gameId] = (time.monotonic() + self.ttl, game, body)
+            self._entries.move_to_end(game.gameId)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, gameId):
+        with self._lock:
+            self._entries.pop(gameId, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    # return the (expiry, game, body) entry of the game, or None if it is not cached or expired
+    # must be called with the lock held
+    def _get_entry(self, gameId):
+        entry = self._entries.get(gameId)
+        if entry is None:
+            return None
+
+        if time.monotonic() >= entry[0]:
+            del self._entries[gameId]
+            return None
+        return entry
+
+
+GAME_CACHE = GameCache(
+    max_size = int(os.environ.get('GAME_CACHE_SIZE', '128')),
+    ttl = float(os.environ.get('GAME_CACHE_TTL', '60')),
+)
+
+class GameHistory:
+    # Bounded history of the fields of recent versions of each game, that
+    # patches are made from
+    # Only the versions this container has stored or serialized are kept, at
+    # most max_versions per game, for the max_games most recently used games
+    # The history is not shared between containers, so patches are best
+    # effort: a client whose version was stored or read by another container,
+    # which is common once the two players are served by different containers,
+    # is sent the full game
+
+    def __init__(self, max_versions, max_games):
+        self.max_versions = max_versions
+        self.max_games = max_games
+        self._games: OrderedDict[str, OrderedDict[int, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # fields is the result of game.dict(), and must not be modified afterwards
+    def put(self, fields):
+        if self.max_versions <= 0:
+            return
+
+        with self._lock:
+            versions = self._games.setdefault(fields['gameId'], OrderedDict())
+            self._games.move_to_end(fields['gameId'])
+            versions[fields['version']] = fields
+            versions.move_to_end(fields['version'])
+
+            while len(versions) > self.max_versions:
+                versions.popitem(last=False)
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+
+    # return the fields of the version of the game, or None if it is not kept
+    # the fields are shared, and must not be modified
+    def get(self, gameId, version) -> Optional[dict]:
+        with self._lock:
+            versions = self._games.get(gameId)
+            return None if versions is None else versions.get(version)
 
-    table = dynamodb.Table('rspfootball-games')
+    def clear(self):
+        with self._lock:
+            self._games.clear()
 
-    response = table.get_item(
-        Key = {'gameId': gameId},
-    )
 
-    if 'Item' not in response:
+GAME_HISTORY = GameHistory(
+    max_versions = int(os.environ.get('PATCH_HISTORY_SIZE', '16')),
+    max_games = int(os.environ.get('GAME_CACHE_SIZE', '128')),
+)
+
+# return the body of a response to a client that holds base_version of the
+# game, given the body of the full game at version
+# that is the json of the patch from base_version, if both versions are in the
+# history and the patch is shorter than the full game, otherwise the full body
+def get_patch_body(gameId, base_version, version, body) -> str:
+    if base_version is None or base_version > version:
+        return body
+
+    base = GAME_HISTORY.get(gameId, base_version)
+    fields = GAME_HISTORY.get(gameId, version)
+    if base is None or fields is None:
+        return body
+
+    patch = json.dumps(rsppatch.make_patch(base, fields))
+    return patch if len(patch) < len(body) else body
+
+# return the game, or None if it does not exist
+# if the game is cached, only its version is read from the store, and the full
+# game is only read if the cached copy is out of date
+# if the caller already knows the stored version, it can pass it to skip that read
+def get_game(gameId, version=None) -> Game:
+    if version is None and GAME_CACHE.get_version(gameId) is not None:
+        version = get_game_version(gameId)
+
+    game = GAME_CACHE.get(gameId, version)
+    if game is not None:
+        return game
+
+    game = rspstore.get_store().get_game(gameId)
+    if game is None:
+        GAME_CACHE.invalidate(gameId)
+    else:
+        GAME_CACHE.put(game)
+    return game
+
+# return the json body of the game, as returned by the api, or None if it
+# does not exist
+# the body is serialized once per version, and cached with the game, so every
+# caller asking for the same version gets the same string
+# the fields of a game that is read are kept in the history
+def get_game_body(gameId, version=None) -> Optional[str]:
+    if version is None and GAME_CACHE.get_version(gameId) is not None:
+        version = get_game_version(gameId)
+
+    body = GAME_CACHE.get_body(gameId, version)
+    if body is not None:
+        return body
+
+    game = rspstore.get_store().get_game(gameId)
+    if game is None:
+        GAME_CACHE.invalidate(gameId)
         return None
 
-    return Game(**response['Item'])
+    fields = game.dict()
+    body = json.dumps(fields)
+    GAME_CACHE.put(game, body)
+    GAME_HISTORY.put(fields)
+    return body
 
-class ConditionalCheckFailedException(Exception):
-    pass
+# return the version of the game without reading the rest of it, or None if
+# the game does not exist
+def get_game_version(gameId):
+    return rspstore.get_store().get_game_version(gameId)
 
-def store_game(game: Game, condition=None):
-    dynamodb = boto3.resource('dynamodb')
+# raise ConditionalCheckFailedException if expected_version is given and the
+# stored game is at a different version, or if create is True and the game exists
+# the exception carries the stored game if the store returned it, and that game
+# replaces the cached one
+# player and action are recorded by stores that keep an action log
+# the stored game is written through to the game cache and history, and its
+# version is published to waiting pollers
+# return the json body of the stored game; the game is serialized once, for
+# both the stored item and the body
+def store_game(game: Game, expected_version=None, create=False, player=None, action=None) -> str:
+    fields = game.dict()
+    try:
+        rspstore.get_store().store_game(game, expected_version=expected_version, create=create, player=player, action=action, fields=fields)
+    except ConditionalCheckFailedException as e:
+        if e.game is None:
+            GAME_CACHE.invalidate(game.gameId)
+        else:
+            GAME_CACHE.put(e.game)
+        raise
+
+    body = json.dumps(fields)
+    GAME_CACHE.put(game, body)
+    GAME_HISTORY.put(fields)
+    rspnotify.get_notifier().publish(game.gameId, game.version)
+    return body
 
-    table = dynamodb.Table('rspfootball-games')
+# return True if first RSPs can be stored with submit_rsp
+def supports_submit_rsp():
+    return rspstore.get_store().supports_submit_rsp()
 
-    game = game.dict()
+# store the first RSP of an exchange, see GameStore.submit_rsp
+# the stored game, as returned by the write, is written through to the game
+# cache and history, since fields another writer changed since game was read
+# are not in game
+# return the stored game and its json body
+# raise ConditionalCheckFailedException if the game is no longer waiting for
+# the first RSP, with the stored game if the store returned it
+def submit_rsp(game: Game, player, action, state) -> tuple[Game, str]:
     try:
-        if condition is None:
-            table.put_item(Item = game)
+        game = rspstore.get_store().submit_rsp(game, player, action, state)
+    except ConditionalCheckFailedException as e:
+        if e.game is None:
+            GAME_CACHE.invalidate(game.gameId)
         else:
-            table.put_item(
-                Item = game,
-                ConditionExpression = condition,
-            )
-    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException as e:
-        raise ConditionalCheckFailedException(e)
-
-# given an object, convert all sub-elements of type Decimal to int
-# modify the argument as needed, and return the converted form
-def convert_decimals(obj):
-    if type(obj) is decimal.Decimal:
-        return int(obj)
-    
-    if type(obj) is dict:
-        for key, value in obj.items():
-            obj[key] = convert_decimals(value)
-    elif type(obj) == list:
-        for index, value in enumerate(obj):
-            obj[index] = convert_decimals(value)
-    
-    return obj
+            GAME_CACHE.put(e.game)
+        raise
+
+    fields = game.dict()
+    body = json.dumps(fields)
+    GAME_CACHE.put(game, body)
+    GAME_HISTORY.put(fields)
+    rspnotify.get_notifier().publish(game.gameId, game.version)
+    return game, body
+
+# raise ConditionalCheckFailedException if the game cannot be joined by the user
+# return the new version of the game
+def join_game(gameId, user):
+    GAME_CACHE.invalidate(gameId)
+    version = rspstore.get_store().join_game(gameId, user)
+    rspnotify.get_notifier().publish(gameId, version)
+    return version
+
+# block until a version of the game after the given version is stored, or the
+# timeout passes
+# return the version of the game, or None if it does not exist, and the number
+# of times the version was read from the store
+# the version is read from the store unless a notification gave it, and with a
+# notifier that does not see every write, it is read again after each of the
+# given intervals
+def wait_for_version(gameId, version, timeout, intervals):
+    notifier = rspnotify.get_notifier()
+    stop_time = time.monotonic() + timeout
+    intervals = iter(intervals)
+    reads = 0
+
+    while True:
+        remaining = stop_time - time.monotonic()
+        if remaining <= 0:
+            return version, reads
+
+        notified = notifier.wait(gameId, version, remaining if notifier.complete else min(remaining, next(intervals)))
+        if notified is not None:
+            return notified, reads
+
+        current = get_game_version(gameId)
+        reads += 1
+        if current is None or current > version:
+            return current, reads
+
+# return a page of games, and the cursor of the next page, or None
+# raise InvalidCursorException if the cursor is not valid for the query
+def list_games(available, user, limit, cursor=None):
+    return rspstore.get_store().list_games(available, user, limit, cursor)
+
+# return the ActionLogEntry of every version of the game after since_version
+def get_action_log(gameId, since_version=0):
+    return rspstore.get_store().get_action_log(gameId, since_version)
 
 # return 'home', 'away', or None, given the game and user
 def get_player(game: Game, user) -> Player:
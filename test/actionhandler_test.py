@@ -1,13 +1,17 @@
 import unittest
 import sys
 
+from pydantic import ValidationError
+
 sys.path.append(f'src/layers/rspfootball-util')
 sys.path.append(f'src/functions/rspfootball-action-handler')
 
 import rspmodel
-from rspmodel import BlockedKickResult, CoffinCornerResult, FakeKickResult, GainResult, IncompletePassResult, KickoffChoiceAction, LossResult, OutOfBoundsPassResult, Play, RollAction, ScoreResult, ScoreType, State, TouchbackChoice, TouchbackResult, TurnoverResult, TurnoverType
+from rspmodel import BlockedKickResult, CoffinCornerResult, FakeKickResult, GainResult, IncompletePassResult, KickoffChoiceAction, LossResult, OutOfBoundsPassResult, Play, RollAction, RollResult, ScoreResult, ScoreType, State, TouchbackChoice, TouchbackResult, TurnoverResult, TurnoverType
 import rsputil
+from rspstate import GameState
 import actionhandler
+import statemachine
 
 ACTING_PLAYER = 'home'
 OPPONENT = 'away'
@@ -102,8 +106,9 @@ class ActionHandlerTest(unittest.TestCase):
         if roll:
             mock_roll(roll)
 
-        actionhandler.process_action(game, ACTING_PLAYER, action)
-        self.assertValues(game.dict(), expected_game)
+        state = GameState.from_game(game)
+        actionhandler.process_action(state, ACTING_PLAYER, action)
+        self.assertValues(state.to_game(game).dict(), expected_game)
 
     def test_rsp_first_action(self):
         self.action_test_helper(init_game = {
@@ -1629,6 +1634,26 @@ class ActionHandlerTest(unittest.TestCase):
             'result': AssertionPredicate.containsAll([IncompletePassResult()])
         }, roll = [5])
 
+    def test_pick_roll_failure_results_follow_end_of_play(self):
+        self.action_test_helper(init_game = {
+            'state': State.PICK_ROLL,
+            'possession': OPPONENT,
+            'play': Play.SHORT_PASS,
+            'ballpos': 20,
+            'down': 4,
+            'firstDown': 30
+        }, action = rspmodel.RollAction(
+            count = 1
+        ), expected_game = {
+            'state': State.PLAY_CALL,
+            'possession': ACTING_PLAYER,
+            'result': [
+                RollResult(player = ACTING_PLAYER, roll = [5]),
+                TurnoverResult(type = TurnoverType.DOWNS),
+                IncompletePassResult(),
+            ]
+        }, roll = [5])
+
     def test_pick_roll_short_pass_touchback(self):
         self.action_test_helper(init_game = {
             'state': State.PICK_ROLL,
@@ -3069,6 +3094,176 @@ class ActionHandlerRegistrationTest(unittest.TestCase):
                     handlers[(state, action)] = handler
 
 
+class DispatchTableTest(unittest.TestCase):
+
+    def test_every_handler_is_dispatched(self):
+        for handler in actionhandler.ACTION_HANDLERS:
+            for state in handler.states:
+                for action_type in handler.actions:
+                    self.assertIs(actionhandler.DISPATCH_TABLE[(state, action_type)], handler)
+
+    def test_duplicate_handlers(self):
+        handlers = actionhandler.ACTION_HANDLERS + [actionhandler.handlers.CoinTossActionHandler()]
+        with self.assertRaises(Exception):
+            actionhandler.build_dispatch_table(handlers)
+
+    def test_unhandled_state(self):
+        handlers = [handler for handler in actionhandler.ACTION_HANDLERS if State.FUMBLE not in handler.states]
+        with self.assertRaises(Exception):
+            actionhandler.build_dispatch_table(handlers)
+
+    def test_no_handler_for_action(self):
+        game = rspmodel.Game(**{**BASE_GAME.dict(), 'state': State.COIN_TOSS})
+        with self.assertRaises(Exception):
+            actionhandler.process_action(GameState.from_game(game), ACTING_PLAYER, RollAction(count=1))
+
+class StateMachineTest(unittest.TestCase):
+
+    def test_every_choice_has_a_rule(self):
+        handlers = actionhandler.handlers
+        for handler in actionhandler.ACTION_HANDLERS:
+            if not isinstance(handler, handlers.ChoiceActionHandler):
+                continue
+            for state in handler.states:
+                for action_type in handler.actions:
+                    choice_type = action_type.__fields__[handler.choice_field].type_
+                    for choice in choice_type:
+                        self.assertIn((state, choice), handlers.RULE_TABLE)
+
+    def test_every_rsp_outcome_has_a_rule(self):
+        handlers = actionhandler.handlers
+        for handler in actionhandler.ACTION_HANDLERS:
+            # the coin toss has no possession, so it has no LOSS
+            if not isinstance(handler, handlers.RspActionHandler) or isinstance(handler, handlers.CoinTossActionHandler):
+                continue
+            for state in handler.states:
+                for outcome in [statemachine.WIN, statemachine.LOSS, statemachine.TIE]:
+                    self.assertIn((state, outcome), handlers.RULE_TABLE)
+
+    def test_every_roll_sum_has_a_rule(self):
+        handlers = actionhandler.handlers
+        for handler in actionhandler.ACTION_HANDLERS:
+            if not isinstance(handler, handlers.RollActionHandler) or type(handler).get_roll_outcome != handlers.RollActionHandler.get_roll_outcome:
+                continue
+            for state in handler.states:
+                for count in handler.allowed_counts:
+                    for total in range(count, 6 * count + 1):
+                        self.assertIn((state, total), handlers.RULE_TABLE)
+
+    def test_every_pick_roll_outcome_has_a_rule(self):
+        handlers = actionhandler.handlers
+        for outcome in [Play.SHORT_PASS, Play.LONG_PASS, Play.BOMB, handlers.NO_PICK]:
+            self.assertIn((State.PICK_ROLL, outcome), handlers.RULE_TABLE)
+
+    def test_every_handled_state_has_a_rule(self):
+        states = {rule.state for rule in actionhandler.handlers.RULES}
+        for state, _ in actionhandler.DISPATCH_TABLE:
+            self.assertIn(state, states)
+
+    def test_duplicate_rules(self):
+        rules = actionhandler.handlers.RULES + [statemachine.Rule(State.PUNT, 'RSP', statemachine.TIE, target=State.PUNT_BLOCK)]
+        with self.assertRaises(Exception):
+            statemachine.compile_rules(rules)
+
+    def test_rule_without_target(self):
+        with self.assertRaises(Exception):
+            statemachine.compile_rules([statemachine.Rule(State.PUNT, 'RSP', statemachine.TIE)])
+
+    def test_overlapping_roll_rules(self):
+        rules = [
+            statemachine.Rule(State.SACK_ROLL, 'ROLL', range(1, 4), target=State.PLAY_CALL),
+            statemachine.Rule(State.SACK_ROLL, 'ROLL', range(3, 7), target=State.PLAY_CALL),
+        ]
+        with self.assertRaises(Exception):
+            statemachine.compile_rules(rules)
+
+    def test_effect_without_targets(self):
+        def undeclared(game):
+            pass
+        with self.assertRaises(Exception):
+            statemachine.compile_rules([statemachine.Rule(State.PUNT, 'RSP', statemachine.TIE, effect=undeclared)])
+
+    def test_rule_updates_are_copied(self):
+        game = GameState.from_game(rspmodel.Game(**{**BASE_GAME.dict(), 'state': State.BOMB, 'possession': ACTING_PLAYER}))
+        rule = actionhandler.handlers.RULE_TABLE[(State.BOMB, statemachine.WIN)]
+        statemachine.apply_rule(game, ACTING_PLAYER, rule)
+        game.roll += [3]
+
+        self.assertEqual(rule.updates['roll'], [])
+        self.assertEqual(game.state, State.BOMB_ROLL)
+        self.assertEqual(game.actions[ACTING_PLAYER], ['ROLL'])
+
+    def test_plantuml_transitions(self):
+        lines = statemachine.get_plantuml_transitions(actionhandler.handlers.RULES)
+        self.assertIn('LONG_RUN --> SACK_ROLL: RSP\\nLOSS', lines)
+        self.assertIn('LONG_RUN --> END_PLAY: RSP\\nTIE', lines)
+        self.assertIn('PAT_CHOICE --> EXTRA_POINT: PAT_CHOICE\\nONE_POINT', lines)
+        self.assertIn('KICK_RETURN --> KICK_RETURN_1: ROLL\\n1', lines)
+        self.assertIn('KICK_RETURN --> END_KICK_RETURN: ROLL\\n2-5', lines)
+        self.assertIn('BOMB_ROLL --> PROCESS_BOMB_ROLL: ROLL', lines)
+        self.assertIn('state END_PLAY <<choice>>', lines)
+        self.assertIn('END_PLAY --> TOUCHDOWN', lines)
+        self.assertIn('TOUCHDOWN --> PAT_CHOICE', lines)
+
+    def test_plantuml_transitions_reach_every_state(self):
+        lines = statemachine.get_plantuml_transitions(actionhandler.handlers.RULES)
+        targets = {line.split(' --> ')[1].split(':')[0] for line in lines if ' --> ' in line}
+        for state in State:
+            if state != State.COIN_TOSS:
+                self.assertIn(state.value, targets)
+
+class ActionRequestTest(unittest.TestCase):
+
+    def test_action_parsed_by_name(self):
+        request = rspmodel.ActionRequest(gameId='game1', user='harry', action={'name': 'ROLL', 'count': 1})
+        self.assertEqual(request.action, RollAction(count=1))
+
+    def test_single_error_for_invalid_action(self):
+        with self.assertRaises(ValidationError) as context:
+            rspmodel.ActionRequest(gameId='game1', user='harry', action={'name': 'ROLL', 'count': 'one'})
+        self.assertEqual(len(context.exception.errors()), 1)
+        self.assertEqual(context.exception.errors()[0]['loc'], ('action', 'RollAction', 'count'))
+
+    def test_unknown_action_name(self):
+        with self.assertRaises(ValidationError) as context:
+            rspmodel.ActionRequest(gameId='game1', user='harry', action={'name': 'DANCE'})
+        self.assertEqual(len(context.exception.errors()), 1)
+
+    def test_results_parsed_by_name(self):
+        game = rspmodel.Game(**{**BASE_GAME.dict(), 'result': [{'name': 'INCOMPLETE'}, {'name': 'SCORE', 'type': 'SAFETY'}]})
+        self.assertEqual(game.result, [IncompletePassResult(), ScoreResult(type=ScoreType.SAFETY)])
+
+
+class ResultLogTest(unittest.TestCase):
+
+    def state(self, version, result, log_versions):
+        game = BASE_GAME.copy(deep=True)
+        game.version = version
+        game.result = result
+        game.resultLog = [rspmodel.ResultLogEntry(version=log_version, result=[TouchbackResult()]) for log_version in log_versions]
+        return GameState.from_game(game)
+
+    def test_results_are_logged(self):
+        state = self.state(5, [TouchbackResult(), IncompletePassResult()], [3])
+        actionhandler.log_results(state)
+
+        self.assertEqual([entry.version for entry in state.resultLog], [3, 5])
+        self.assertEqual(state.resultLog[-1].result, [TouchbackResult(), IncompletePassResult()])
+
+    def test_old_entries_are_dropped(self):
+        state = self.state(rspmodel.RESULT_LOG_VERSIONS + 2, [TouchbackResult()], [1, 2, 3])
+        actionhandler.log_results(state)
+
+        self.assertEqual([entry.version for entry in state.resultLog], [3, rspmodel.RESULT_LOG_VERSIONS + 2])
+
+    def test_no_results_leave_log(self):
+        state = self.state(rspmodel.RESULT_LOG_VERSIONS + 2, [], [1])
+        log = state.resultLog
+        actionhandler.log_results(state)
+
+        self.assertIs(state.resultLog, log)
+
+
 if __name__ == '__main__':
     rsputil.configure_logger()
     unittest.main()
@@ -0,0 +1,89 @@
+import json
+import unittest
+import sys
+import zlib
+
+sys.path.append(f'src/layers/rspfootball-util')
+sys.path.append(f'src/functions/rspfootball-new-game')
+
+import rspcodec
+import rspmodel
+from rspmodel import Play, State
+import newgame
+
+
+def played_game():
+    game = newgame.new_game('game1')
+    game.version = 12
+    game.players = {'home': 'harry', 'away': 'daylin'}
+    game.state = State.SHORT_PASS_CONT
+    game.play = Play.SHORT_PASS
+    game.possession = 'away'
+    game.firstKick = 'home'
+    game.firstDown = 45
+    game.rsp['home'] = 'PAPER'
+    game.roll = [3, 4]
+    game.score = {'home': 7, 'away': 3}
+    game.actions = {'home': ['POLL'], 'away': ['RSP', 'PENALTY']}
+    game.result = [
+        rspmodel.RspResult(home='ROCK', away='PAPER'),
+        rspmodel.RollResult(player='away', roll=[3, 4]),
+        rspmodel.ScoreResult(type='FIELD_GOAL'),
+        rspmodel.GainResult(play='SHORT_PASS', player='away', yards=10),
+        rspmodel.LossResult(play='BOMB', player='home', yards=15),
+        rspmodel.TurnoverResult(type='PICK'),
+        rspmodel.OutOfBoundsPassResult(),
+        rspmodel.OutOfBoundsKickResult(),
+        rspmodel.TouchbackResult(),
+        rspmodel.IncompletePassResult(),
+        rspmodel.CoffinCornerResult(),
+        rspmodel.FakeKickResult(),
+        rspmodel.BlockedKickResult(),
+        rspmodel.KickoffElectionResult(choice='RECIEVE'),
+    ]
+    game.resultLog = [
+        rspmodel.ResultLogEntry(version=10, result=[rspmodel.RspResult(home='ROCK', away='ROCK')]),
+        rspmodel.ResultLogEntry(version=12, result=game.result),
+    ]
+    return game
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        game = played_game()
+        self.assertEqual(rspmodel.Game(**rspcodec.unpack_game(rspcodec.pack_game(game))), game)
+
+    def test_new_game_round_trip(self):
+        game = newgame.new_game('game1')
+        self.assertEqual(rspcodec.unpack_game(rspcodec.pack_game(game)), game.dict())
+
+    def test_plain_string_enum_values(self):
+        game = played_game()
+        game.state = 'PUNT'
+        game.possession = 'home'
+
+        unpacked = rspcodec.unpack_game(rspcodec.pack_game(game))
+        self.assertIs(unpacked['state'], State.PUNT)
+        self.assertIs(unpacked['possession'], rspmodel.Player.home)
+
+    def test_encoding_is_smaller(self):
+        game = played_game()
+        self.assertLess(len(rspcodec.pack_game(game)), len(game.json()) / 2)
+
+    def test_version_1_has_empty_result_log(self):
+        game = played_game()
+        packed = json.loads(zlib.decompress(rspcodec.pack_game(game)[1:]))
+        data = bytes([1]) + zlib.compress(json.dumps(packed[:-1]).encode())
+
+        game.resultLog = []
+        self.assertEqual(rspmodel.Game(**rspcodec.unpack_game(data)), game)
+
+    def test_unsupported_version(self):
+        data = rspcodec.pack_game(played_game())
+        with self.assertRaises(rspcodec.CodecException):
+            rspcodec.unpack_game(bytes([0]) + data[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
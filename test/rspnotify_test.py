@@ -0,0 +1,203 @@
+import itertools
+import json
+import os
+import threading
+import time
+import unittest
+import sys
+
+sys.path.append(f'src/layers/rspfootball-util')
+sys.path.append(f'src/functions/rspfootball-new-game')
+sys.path.append(f'src/functions/rspfootball-poll-game')
+sys.path.append(f'src/functions/rspfootball-game-stream')
+
+import rspnotify
+import rspstore
+import rsputil
+import gamestream
+import newgame
+import pollgame
+
+
+class LocalNotifierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.notifier = rspnotify.LocalNotifier(max_games=2)
+
+    def test_wait_returns_published_version(self):
+        publisher = threading.Timer(0.05, self.notifier.publish, ('game1', 1))
+        publisher.start()
+
+        start = time.monotonic()
+        self.assertEqual(self.notifier.wait('game1', 0, 5), 1)
+        self.assertLess(time.monotonic() - start, 1)
+        publisher.join()
+
+    def test_wait_times_out(self):
+        self.notifier.publish('game2', 1)
+        self.assertIsNone(self.notifier.wait('game1', 0, 0.01))
+
+    def test_earlier_publish_is_seen(self):
+        self.notifier.publish('game1', 2)
+        self.notifier.publish('game1', 1)
+
+        self.assertEqual(self.notifier.wait('game1', 1, 0), 2)
+        self.assertIsNone(self.notifier.wait('game1', 2, 0))
+
+    def test_forgets_oldest_game(self):
+        for game_id in ['game1', 'game2', 'game3']:
+            self.notifier.publish(game_id, 1)
+
+        self.assertIsNone(self.notifier.wait('game1', 0, 0))
+        self.assertEqual(self.notifier.wait('game3', 0, 0), 1)
+
+
+class SocketNotifierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = rspnotify.NotifyServer(('localhost', 0))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.notifier = rspnotify.SocketNotifier(self.server.server_address)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_wait_returns_published_version(self):
+        publisher = threading.Timer(0.05, self.notifier.publish, ('game1', 3))
+        publisher.start()
+
+        self.assertEqual(self.notifier.wait('game1', 2, 5), 3)
+        publisher.join()
+
+    def test_wait_times_out(self):
+        self.assertIsNone(self.notifier.wait('game1', 0, 0.01))
+
+    def test_hub_down(self):
+        notifier = rspnotify.SocketNotifier(('localhost', 1))
+
+        notifier.publish('game1', 1)
+        self.assertIsNone(notifier.wait('game1', 0, 0.01))
+
+
+class PollWakeupTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['NOTIFIER'] = 'local'
+        os.environ['LOG_LEVEL'] = 'INFO'
+        os.environ['MAX_POLL_TIME'] = '5'
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+
+        self.game = newgame.new_game('game1')
+        rsputil.store_game(self.game)
+
+    def tearDown(self):
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+        del os.environ['NOTIFIER']
+
+    def poll(self, version):
+        return pollgame.lambda_handler({'body': json.dumps({'gameId': 'game1', 'version': version})}, None)
+
+    def test_wakes_on_store(self):
+        def store():
+            self.game.version += 1
+            self.game.players['home'] = 'harry'
+            rsputil.store_game(self.game)
+
+        writer = threading.Timer(0.05, store)
+        writer.start()
+
+        start = time.monotonic()
+        response = self.poll(0)
+        writer.join()
+
+        self.assertLess(time.monotonic() - start, 1)
+        body = json.loads(response['body'])
+        self.assertEqual(body['version'], 1)
+        self.assertEqual(body['players']['home'], 'harry')
+
+    def test_wakes_on_join(self):
+        writer = threading.Timer(0.05, rsputil.join_game, ('game1', 'harry'))
+        writer.start()
+
+        start = time.monotonic()
+        response = self.poll(0)
+        writer.join()
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(json.loads(response['body'])['players']['away'], 'harry')
+
+    def test_returns_newer_version_without_waiting(self):
+        start = time.monotonic()
+        response = self.poll(-1)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(json.loads(response['body'])['version'], 0)
+
+    def test_times_out_at_same_version(self):
+        os.environ['MAX_POLL_TIME'] = '0.05'
+
+        response = self.poll(0)
+        self.assertEqual(json.loads(response['body'])['version'], 0)
+
+
+class WaitForVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['NOTIFIER'] = 'none'
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+
+        self.game = newgame.new_game('game1')
+        rsputil.store_game(self.game)
+
+    def tearDown(self):
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+        del os.environ['NOTIFIER']
+
+    def test_reads_version_at_poll_interval(self):
+        # a write the notifier never sees, as from another container
+        self.game.version += 1
+        rspstore.get_store().store_game(self.game)
+
+        start = time.monotonic()
+        self.assertEqual(rsputil.wait_for_version('game1', 0, 5, itertools.repeat(0.01)), (1, 1))
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class GameStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['LOG_LEVEL'] = 'INFO'
+        os.environ['NOTIFIER'] = 'local'
+        rspnotify.reset_notifier()
+
+    def tearDown(self):
+        rspnotify.reset_notifier()
+        del os.environ['NOTIFIER']
+
+    def test_publishes_new_versions(self):
+        gamestream.lambda_handler({'Records': [
+            {'eventName': 'INSERT', 'dynamodb': {'NewImage': {'gameId': {'S': 'game1'}, 'version': {'N': '0'}}}},
+            {'eventName': 'MODIFY', 'dynamodb': {'NewImage': {'gameId': {'S': 'game1'}, 'version': {'N': '4'}}}},
+            {'eventName': 'REMOVE', 'dynamodb': {'OldImage': {'gameId': {'S': 'game2'}, 'version': {'N': '1'}}}},
+        ]}, None)
+
+        notifier = rspnotify.get_notifier()
+        self.assertEqual(notifier.wait('game1', 0, 0), 4)
+        self.assertIsNone(notifier.wait('game2', 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
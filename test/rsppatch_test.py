@@ -0,0 +1,159 @@
+import json
+import os
+import unittest
+import sys
+
+sys.path.append(f'src/layers/rspfootball-util')
+sys.path.append(f'src/functions/rspfootball-action-handler')
+sys.path.append(f'src/functions/rspfootball-join-game')
+sys.path.append(f'src/functions/rspfootball-new-game')
+sys.path.append(f'src/functions/rspfootball-poll-game')
+sys.path.append(f'test')
+
+import rsppatch
+import rspstore
+import rsputil
+import actionhandler
+import joingame
+import newgame
+import pollgame
+from testutil import request
+
+
+class PatchTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        base = newgame.new_game('game1').dict()
+        fields = json.loads(json.dumps(base))
+        fields['version'] = 3
+        fields['players']['away'] = 'daylin'
+        fields['actions']['home'] = ['POLL']
+        fields['result'] = [{'name': 'ROLL', 'player': 'home', 'roll': [1, 2]}]
+
+        patch = rsppatch.make_patch(base, fields)
+
+        self.assertEqual(patch, {
+            'gameId': 'game1',
+            'baseVersion': 0,
+            'version': 3,
+            'set': {
+                'version': 3,
+                'players.away': 'daylin',
+                'actions.home': ['POLL'],
+                'result': [{'name': 'ROLL', 'player': 'home', 'roll': [1, 2]}],
+            },
+        })
+        self.assertTrue(rsppatch.is_patch(patch))
+        self.assertFalse(rsppatch.is_patch(fields))
+        self.assertEqual(rsppatch.apply_patch(base, patch), fields)
+
+    def test_removed_keys(self):
+        base = {'gameId': 'game1', 'version': 0, 'score': {'home': 7, 'away': 0}}
+        fields = {'gameId': 'game1', 'version': 1, 'score': {'home': 7}}
+
+        patch = rsppatch.make_patch(base, fields)
+        self.assertEqual(patch['unset'], ['score.away'])
+        self.assertEqual(rsppatch.apply_patch(base, patch), fields)
+        self.assertEqual(base['score'], {'home': 7, 'away': 0})
+
+    def test_patch_of_other_version(self):
+        patch = {'gameId': 'game1', 'baseVersion': 1, 'version': 2, 'set': {}}
+
+        with self.assertRaises(rsppatch.PatchException):
+            rsppatch.apply_patch({'gameId': 'game1', 'version': 0}, patch)
+
+
+class GameHistoryTest(unittest.TestCase):
+
+    def test_bounded(self):
+        history = rsputil.GameHistory(max_versions=2, max_games=2)
+        for version in range(3):
+            history.put({'gameId': 'game1', 'version': version})
+
+        self.assertIsNone(history.get('game1', 0))
+        self.assertEqual(history.get('game1', 2), {'gameId': 'game1', 'version': 2})
+
+        history.put({'gameId': 'game2', 'version': 0})
+        history.put({'gameId': 'game3', 'version': 0})
+        self.assertIsNone(history.get('game1', 2))
+        self.assertIsNotNone(history.get('game2', 0))
+
+
+class PatchResponseTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['LOG_LEVEL'] = 'INFO'
+        os.environ['MAX_UPDATE_ATTEMPTS'] = '3'
+        os.environ['MAX_POLL_TIME'] = '0'
+        os.environ['ALLOW_OVERWRITES'] = 'false'
+        rspstore.reset_store()
+        rsputil.GAME_CACHE.clear()
+        rsputil.GAME_HISTORY.clear()
+
+        newgame.lambda_handler(request({'gameId': 'game1', 'user': 'harry'}), None)
+        joingame.lambda_handler(request({'gameId': 'game1', 'user': 'daylin'}), None)
+        self.game = json.loads(pollgame.lambda_handler(request({'gameId': 'game1', 'version': -1}), None)['body'])
+
+    def tearDown(self):
+        rspstore.reset_store()
+        rsputil.GAME_CACHE.clear()
+        rsputil.GAME_HISTORY.clear()
+
+    def act(self, user, version, patch=True):
+        return actionhandler.lambda_handler(request({
+            'gameId': 'game1',
+            'user': user,
+            'action': {'name': 'RSP', 'choice': 'ROCK'},
+            'version': version,
+            'patch': patch,
+        }), None)['body']
+
+    def poll(self, version, patch=True):
+        return pollgame.lambda_handler(request({'gameId': 'game1', 'version': version, 'patch': patch}), None)['body']
+
+    def test_action_returns_patch(self):
+        body = self.act('harry', 1)
+        full = rsputil.get_game_body('game1')
+
+        patch = json.loads(body)
+        self.assertTrue(rsppatch.is_patch(patch))
+        self.assertLess(len(body), len(full) / 2)
+        self.assertEqual(rsppatch.apply_patch(self.game, patch), json.loads(full))
+
+    def test_action_of_game_read_from_store(self):
+        # a container that has not seen the client's version keeps it from
+        # the game it reads
+        rsputil.GAME_CACHE.clear()
+        rsputil.GAME_HISTORY.clear()
+
+        patch = json.loads(self.act('harry', 1))
+        self.assertEqual(rsppatch.apply_patch(self.game, patch), json.loads(rsputil.get_game_body('game1')))
+
+    def test_poll_returns_patch(self):
+        self.act('harry', 1, patch=False)
+
+        patch = json.loads(self.poll(1))
+        self.assertEqual(patch['baseVersion'], 1)
+        self.assertEqual(rsppatch.apply_patch(self.game, patch), json.loads(rsputil.get_game_body('game1')))
+
+    def test_full_game_without_history(self):
+        self.act('harry', 1, patch=False)
+        rsputil.GAME_HISTORY.clear()
+
+        self.assertFalse(rsppatch.is_patch(json.loads(self.poll(1))))
+
+    def test_full_game_when_not_asked(self):
+        self.assertFalse(rsppatch.is_patch(json.loads(self.act('harry', 1, patch=False))))
+        self.assertFalse(rsppatch.is_patch(json.loads(self.poll(1, patch=False))))
+
+    def test_full_game_when_patch_is_larger(self):
+        # the base has none of the fields, so the patch holds all of the game
+        rsputil.GAME_HISTORY.put({'gameId': 'game1', 'version': 0})
+
+        body = rsputil.get_game_body('game1')
+        self.assertEqual(rsputil.get_patch_body('game1', 0, 1, body), body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import itertools
+import json
+import os
+import threading
+import unittest
+import sys
+
+sys.path.append(f'src/layers/rspfootball-util')
+sys.path.append(f'src/functions/rspfootball-action-handler')
+sys.path.append(f'src/functions/rspfootball-join-game')
+sys.path.append(f'src/functions/rspfootball-new-game')
+sys.path.append(f'src/functions/rspfootball-poll-game')
+sys.path.append(f'test')
+
+import rspnotify
+import rsppoll
+import rspstore
+import rsputil
+import actionhandler
+import joingame
+import newgame
+import pollgame
+from rspmodel import State
+from testutil import request
+
+
+class PollScheduleTest(unittest.TestCase):
+
+    def test_backs_off_to_cap(self):
+        schedule = rsppoll.PollSchedule(initial=0.1, factor=2, max_interval=0.5)
+        self.assertEqual(list(itertools.islice(schedule.intervals(), 5)), [0.1, 0.2, 0.4, 0.5, 0.5])
+
+    def test_schedule_by_state(self):
+        self.assertIs(rsppoll.get_schedule(State.SHORT_RUN), rsppoll.RSP_SCHEDULE)
+        self.assertIs(rsppoll.get_schedule(State.PLAY_CALL), rsppoll.CHOICE_SCHEDULE)
+        self.assertIs(rsppoll.get_schedule(State.KICKOFF), rsppoll.DEFAULT_SCHEDULE)
+        self.assertIs(rsppoll.get_schedule(None), rsppoll.DEFAULT_SCHEDULE)
+
+    def test_rsp_states_start_faster_than_play_call(self):
+        self.assertLess(rsppoll.get_schedule(State.COIN_TOSS).initial, rsppoll.get_schedule(State.PLAY_CALL).initial)
+
+
+class PollStatsTest(unittest.TestCase):
+
+    def test_compares_with_fixed_schedule(self):
+        stats = rsppoll.PollStats(fixed_interval=0.5)
+        stats.record(reads=3, waited=2.1, changed=True)
+        stats.record(reads=1, waited=0, changed=True)
+        stats.record(reads=4, waited=10, changed=False)
+
+        self.assertEqual(stats.stats(), {
+            'polls': 3,
+            'changes': 2,
+            'reads': 8,
+            'fixedReads': 6 + 1 + 21,
+            'readsPerChange': 4.0,
+            'fixedReadsPerChange': 14.0,
+            'waited': 12.1,
+        })
+
+    def test_no_changes(self):
+        stats = rsppoll.PollStats(fixed_interval=0.5)
+        stats.record(reads=1, waited=0.1, changed=False)
+
+        self.assertIsNone(stats.stats()['readsPerChange'])
+
+
+class AdaptivePollTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['NOTIFIER'] = 'none'
+        os.environ['LOG_LEVEL'] = 'INFO'
+        os.environ['MAX_POLL_TIME'] = '5'
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+        pollgame.POLL_STATS.clear()
+
+        self.game = newgame.new_game('game1')
+        self.game.state = State.SHORT_RUN
+        rsputil.store_game(self.game)
+
+    def tearDown(self):
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+        del os.environ['NOTIFIER']
+
+    def poll(self, version):
+        return pollgame.lambda_handler({'body': json.dumps({'gameId': 'game1', 'version': version})}, None)
+
+    def test_quick_answer_costs_fewer_reads_than_fixed_schedule(self):
+        def answer():
+            self.game.version += 1
+            rspstore.get_store().store_game(self.game)
+
+        writer = threading.Timer(0.3, answer)
+        writer.start()
+        response = self.poll(0)
+        writer.join()
+
+        self.assertEqual(json.loads(response['body'])['version'], 1)
+
+        stats = pollgame.POLL_STATS.stats()
+        self.assertEqual(stats['changes'], 1)
+        # the fast start of the RSP schedule sees the answer well before the
+        # first read of the fixed schedule would
+        self.assertLess(stats['waited'], 0.5)
+        self.assertEqual(stats['fixedReads'], 2)
+
+    def test_newer_version_is_one_read(self):
+        self.poll(-1)
+
+        stats = pollgame.POLL_STATS.stats()
+        self.assertEqual(stats['reads'], 1)
+        self.assertEqual(stats['readsPerChange'], 1.0)
+
+    def test_timeout_is_not_a_change(self):
+        os.environ['MAX_POLL_TIME'] = '0.1'
+
+        self.poll(0)
+
+        stats = pollgame.POLL_STATS.stats()
+        self.assertEqual(stats['changes'], 0)
+        self.assertGreater(stats['reads'], 1)
+
+
+class CatchUpPollTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['NOTIFIER'] = 'none'
+        os.environ['LOG_LEVEL'] = 'INFO'
+        os.environ['MAX_UPDATE_ATTEMPTS'] = '3'
+        os.environ['MAX_POLL_TIME'] = '0'
+        os.environ['ALLOW_OVERWRITES'] = 'false'
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+
+        newgame.lambda_handler(request({'gameId': 'game1', 'user': 'harry'}), None)
+        joingame.lambda_handler(request({'gameId': 'game1', 'user': 'daylin'}), None)
+
+    def tearDown(self):
+        rspstore.reset_store()
+        rspnotify.reset_notifier()
+        rsputil.GAME_CACHE.clear()
+        del os.environ['NOTIFIER']
+
+    def act(self, user, action):
+        response = actionhandler.lambda_handler(request({'gameId': 'game1', 'user': user, 'action': action}), None)
+        self.assertEqual(response['statusCode'], 200, response['body'])
+
+    def test_poll_has_every_result_since_client_version(self):
+        # the coin toss, then the winner's kickoff election, while harry is
+        # not polling
+        self.act('harry', {'name': 'RSP', 'choice': 'ROCK'})
+        self.act('daylin', {'name': 'RSP', 'choice': 'SCISSORS'})
+        self.act('harry', {'name': 'KICKOFF_ELECTION', 'choice': 'KICK'})
+
+        game = json.loads(pollgame.lambda_handler(request({'gameId': 'game1', 'version': 2}), None)['body'])
+
+        self.assertEqual(game['version'], 4)
+        missed = [entry for entry in game['resultLog'] if entry['version'] > 2]
+        self.assertEqual([entry['version'] for entry in missed], [3, 4])
+        self.assertEqual(missed[0]['result'], [{'name': 'RSP', 'home': 'ROCK', 'away': 'SCISSORS'}])
+        self.assertEqual(missed[1]['result'], game['result'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+import json
+import os
+import socket
+import threading
+import unittest
+from unittest import mock
+import sys
+
+from botocore.stub import ANY, Stubber
+
+sys.path.append(f'src/layers/rspfootball-util')
+sys.path.append(f'src/functions/rspfootball-action-handler')
+sys.path.append(f'src/functions/rspfootball-join-game')
+sys.path.append(f'src/functions/rspfootball-new-game')
+sys.path.append(f'src/functions/rspfootball-ws-connect')
+sys.path.append(f'src/functions/rspfootball-ws-disconnect')
+sys.path.append(f'test')
+
+import rsppush
+import rspstore
+import rsputil
+import actionhandler
+import joingame
+import newgame
+import wsconnect
+import wsdisconnect
+from testutil import request
+
+
+class MemoryConnectionRegistryTest(unittest.TestCase):
+
+    def test_connections_by_game(self):
+        registry = rsppush.MemoryConnectionRegistry()
+        registry.add('c1', 'game1', 'harry')
+        registry.add('c2', 'game1')
+        registry.add('c3', 'game2', 'daylin')
+        registry.remove('c1')
+        registry.remove('c4')
+
+        self.assertEqual(registry.get_connections('game1'), ['c2'])
+        self.assertEqual(registry.get_connections('game3'), [])
+
+
+class DynamoConnectionRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+        self.registry = rsppush.DynamoConnectionRegistry()
+        self.stubber = Stubber(self.registry.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_get_connections_pages(self):
+        query = {
+            'TableName': rsppush.CONNECTIONS_TABLE,
+            'IndexName': rsppush.GAME_CONNECTIONS_INDEX,
+            'KeyConditionExpression': 'gameId = :id',
+            'ExpressionAttributeValues': {':id': {'S': 'game1'}},
+            'ProjectionExpression': 'connectionId',
+        }
+        last_key = {'connectionId': {'S': 'c1'}, 'gameId': {'S': 'game1'}}
+        self.stubber.add_response('query', {'Items': [{'connectionId': {'S': 'c1'}}], 'LastEvaluatedKey': last_key}, query)
+        self.stubber.add_response('query', {'Items': [{'connectionId': {'S': 'c2'}}]}, {**query, 'ExclusiveStartKey': last_key})
+
+        self.assertEqual(self.registry.get_connections('game1'), ['c1', 'c2'])
+        self.stubber.assert_no_pending_responses()
+
+    def test_spectator_has_no_user(self):
+        self.stubber.add_response('put_item', {}, {
+            'TableName': rsppush.CONNECTIONS_TABLE,
+            'Item': {'connectionId': {'S': 'c1'}, 'gameId': {'S': 'game1'}, 'ttl': {'N': ANY}},
+        })
+
+        self.registry.add('c1', 'game1')
+        self.stubber.assert_no_pending_responses()
+
+
+class ApiGatewayPusherTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+        self.registry = rsppush.MemoryConnectionRegistry()
+        self.pusher = rsppush.ApiGatewayPusher('https://example.execute-api.us-west-2.amazonaws.com/prod', self.registry)
+        self.stubber = Stubber(self.pusher.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_gone_connections_are_removed(self):
+        self.registry.add('c1', 'game1', 'harry')
+        self.registry.add('c2', 'game1')
+        self.registry.add('c3', 'game2')
+
+        self.stubber.add_response('post_to_connection', {}, {'ConnectionId': 'c1', 'Data': b'{"version": 1}'})
+        self.stubber.add_client_error('post_to_connection', 'GoneException', http_status_code=410,
+            expected_params={'ConnectionId': 'c2', 'Data': b'{"version": 1}'})
+
+        self.pusher.broadcast('game1', '{"version": 1}')
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(self.registry.get_connections('game1'), ['c1'])
+
+    def test_client_has_short_timeouts(self):
+        config = self.pusher.client.meta.config
+        self.assertEqual(config.connect_timeout, rsppush.PUSH_CONFIG.connect_timeout)
+        self.assertEqual(config.read_timeout, rsppush.PUSH_CONFIG.read_timeout)
+        self.assertEqual(config.retries, rsppush.PUSH_CONFIG.retries)
+
+    def test_broadcast_stops_at_timeout(self):
+        self.registry.add('c1', 'game1')
+        self.registry.add('c2', 'game1')
+
+        self.stubber.add_response('post_to_connection', {}, {'ConnectionId': 'c1', 'Data': b'{"version": 1}'})
+
+        # the post to c1 takes longer than the timeout of the broadcast
+        with mock.patch.object(rsppush.time, 'monotonic', side_effect=[0, 0, self.pusher.timeout + 1]):
+            self.pusher.broadcast('game1', '{"version": 1}')
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(self.registry.get_connections('game1'), ['c1', 'c2'])
+
+
+# runs a PushServer for the test, with the PUSHER of the lambdas pointed at it
+class PushServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = rsppush.PushServer(('localhost', 0))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.connections = []
+
+        os.environ['PUSHER'] = 'socket'
+        os.environ['PUSH_ADDRESS'] = '%s:%d' % self.server.server_address
+        rsppush.reset_push()
+
+    def tearDown(self):
+        for connection in self.connections:
+            connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        rsppush.reset_push()
+        del os.environ['PUSHER']
+
+    # connect a client to the game, and return a reader of the lines it is sent
+    def connect(self, game_id, user=None):
+        connection = socket.create_connection(self.server.server_address, timeout=5)
+        self.connections.append(connection)
+        connection.sendall((json.dumps({'op': 'connect', 'gameId': game_id, 'user': user}) + '\n').encode())
+
+        reader = connection.makefile('r')
+        self.assertIn('connectionId', json.loads(reader.readline()))
+        return reader
+
+
+class PushServerTest(PushServerTestCase):
+
+    def test_broadcast_reaches_connections_of_the_game(self):
+        player = self.connect('game1', 'harry')
+        spectator = self.connect('game1')
+        other = self.connect('game2')
+
+        rsppush.broadcast('game1', '{"version": 1}')
+        rsppush.broadcast('game2', '{"version": 7}')
+
+        self.assertEqual(player.readline(), '{"version": 1}\n')
+        self.assertEqual(spectator.readline(), '{"version": 1}\n')
+        self.assertEqual(other.readline(), '{"version": 7}\n')
+
+class GamePushTest(PushServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['LOG_LEVEL'] = 'INFO'
+        os.environ['MAX_UPDATE_ATTEMPTS'] = '3'
+        os.environ['ALLOW_OVERWRITES'] = 'false'
+        rspstore.reset_store()
+        rsputil.GAME_CACHE.clear()
+
+        newgame.lambda_handler(request({'gameId': 'game1', 'user': 'harry'}), None)
+
+    def tearDown(self):
+        super().tearDown()
+        rspstore.reset_store()
+
+    def test_join_and_action_are_pushed(self):
+        spectator = self.connect('game1')
+
+        joingame.lambda_handler(request({'gameId': 'game1', 'user': 'daylin'}), None)
+        joined = json.loads(spectator.readline())
+        self.assertEqual(joined['version'], 1)
+        self.assertEqual(joined['players']['away'], 'daylin')
+
+        response = actionhandler.lambda_handler(request({
+            'gameId': 'game1',
+            'user': 'harry',
+            'action': {'name': 'RSP', 'choice': 'ROCK'}
+        }), None)
+        self.assertEqual(spectator.readline(), response['body'] + '\n')
+
+
+class BroadcastFailureTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['PUSHER'] = 'socket'
+        os.environ['PUSH_ADDRESS'] = 'localhost:1'
+        rsppush.reset_push()
+
+    def tearDown(self):
+        rsppush.reset_push()
+        del os.environ['PUSHER']
+
+    def test_failure_is_not_raised(self):
+        with self.assertLogs('rsppush', 'WARNING'):
+            rsppush.broadcast('game1', '{"version": 1}')
+
+
+class WebSocketRouteTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['CONNECTION_STORE'] = 'memory'
+        os.environ['LOG_LEVEL'] = 'INFO'
+        rspstore.reset_store()
+        rsppush.reset_push()
+        rsputil.GAME_CACHE.clear()
+
+        rsputil.store_game(newgame.new_game('game1'))
+
+    def tearDown(self):
+        rspstore.reset_store()
+        rsppush.reset_push()
+        del os.environ['CONNECTION_STORE']
+
+    def route(self, handler, connection_id, query_params=None):
+        return handler.lambda_handler({
+            'requestContext': {'connectionId': connection_id},
+            'queryStringParameters': query_params,
+        }, None)
+
+    def test_connect_and_disconnect(self):
+        self.assertEqual(self.route(wsconnect, 'c1', {'gameId': 'game1', 'user': 'harry'})['statusCode'], 200)
+        self.assertEqual(self.route(wsconnect, 'c2', {'gameId': 'game1'})['statusCode'], 200)
+        self.assertEqual(rsppush.get_registry().get_connections('game1'), ['c1', 'c2'])
+
+        self.route(wsdisconnect, 'c1')
+        self.assertEqual(rsppush.get_registry().get_connections('game1'), ['c2'])
+
+    def test_connect_to_unknown_game(self):
+        self.assertEqual(self.route(wsconnect, 'c1', {'gameId': 'game2'})['statusCode'], 400)
+        self.assertEqual(self.route(wsconnect, 'c1', {})['statusCode'], 400)
+        self.assertEqual(rsppush.get_registry().get_connections('game2'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import json
+import os
+import time
+import unittest
+import sys
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+sys.path.append(f'src/layers/rspfootball-util')
+sys.path.append(f'src/functions/rspfootball-action-handler')
+sys.path.append(f'src/functions/rspfootball-join-game')
+sys.path.append(f'src/functions/rspfootball-new-game')
+sys.path.append(f'test')
+
+import rspretry
+import rspstore
+import rsputil
+import actionhandler
+import joingame
+import newgame
+from testutil import request
+
+def throttling_error():
+    return ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'slow down'}}, 'PutItem')
+
+class Context:
+
+    def __init__(self, remaining_millis):
+        self.remaining_millis = remaining_millis
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_millis
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_attempts(self):
+        policy = rspretry.RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+        self.assertEqual(list(policy.attempts()), [1, 2, 3])
+
+    def test_delays_are_capped(self):
+        policy = rspretry.RetryPolicy(max_attempts=10, base_delay=0.1, max_delay=0.3)
+        for failures in range(1, 10):
+            delay = policy.get_delay(failures)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(0.3, 0.1 * 2 ** (failures - 1)))
+
+    def test_deadline_stops_retries(self):
+        policy = rspretry.RetryPolicy(max_attempts=5, base_delay=0, max_delay=0, deadline=time.monotonic() - 1)
+        # the first attempt is always made
+        self.assertEqual(list(policy.attempts()), [1])
+
+    def test_deadline_from_context(self):
+        deadline = rspretry.get_deadline(Context(5000), margin=1)
+        self.assertAlmostEqual(deadline, time.monotonic() + 4, delta=0.1)
+        self.assertIsNone(rspretry.get_deadline(None))
+
+    def test_is_throttling(self):
+        self.assertTrue(rspretry.is_throttling(throttling_error()))
+        self.assertFalse(rspretry.is_throttling(ClientError({'Error': {'Code': 'ValidationException'}}, 'PutItem')))
+        self.assertFalse(rspretry.is_throttling(Exception()))
+
+
+class ActionRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        os.environ['LOG_LEVEL'] = 'INFO'
+        os.environ['MAX_UPDATE_ATTEMPTS'] = '3'
+        os.environ['RETRY_BASE_DELAY'] = '0'
+        os.environ['ALLOW_OVERWRITES'] = 'false'
+        rspstore.reset_store()
+        rsputil.GAME_CACHE.clear()
+
+        newgame.lambda_handler(request({'gameId': 'game1', 'user': 'harry'}), None)
+        joingame.lambda_handler(request({'gameId': 'game1', 'user': 'daylin'}), None)
+
+        # the first RSP is stored without a version condition, so the actions
+        # under test are the RSPs that resolve the coin toss
+        actionhandler.lambda_handler(request({
+            'gameId': 'game1',
+            'user': 'harry',
+            'action': {'name': 'RSP', 'choice': 'ROCK'}
+        }), None)
+
+    def tearDown(self):
+        rspstore.reset_store()
+        del os.environ['RETRY_BASE_DELAY']
+
+    def act(self, context=None):
+        return actionhandler.lambda_handler(request({
+            'gameId': 'game1',
+            'user': 'daylin',
+            'action': {'name': 'RSP', 'choice': 'SCISSORS'}
+        }), context)
+
+    # make the store fail the first writes with the given exceptions
+    def fail_stores(self, *exceptions):
+        store = rspstore.get_store()
+        store_game = store.store_game
+        failures = list(exceptions)
+
+        def failing_store_game(*args, **kwargs):
+            if failures:
+                raise failures.pop(0)
+            return store_game(*args, **kwargs)
+        return mock.patch.object(store, 'store_game', failing_store_game)
+
+    def test_first_attempt(self):
+        response = self.act()
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(response['headers'][actionhandler.ATTEMPTS_HEADER], '1')
+
+    def test_conflict_is_retried(self):
+        with self.fail_stores(rsputil.ConditionalCheckFailedException()):
+            response = self.act()
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(response['headers'][actionhandler.ATTEMPTS_HEADER], '2')
+        self.assertEqual(rsputil.get_game('game1').version, 3)
+
+    def test_throttling_is_retried(self):
+        with self.fail_stores(throttling_error(), throttling_error()):
+            response = self.act()
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(response['headers'][actionhandler.ATTEMPTS_HEADER], '3')
+
+    def test_persistent_conflict(self):
+        with self.fail_stores(*[rsputil.ConditionalCheckFailedException() for _ in range(3)]):
+            response = self.act()
+
+        self.assertEqual(response['statusCode'], 409)
+        self.assertEqual(response['headers'][actionhandler.ATTEMPTS_HEADER], '3')
+
+    def test_persistent_throttling(self):
+        with self.fail_stores(*[throttling_error() for _ in range(3)]):
+            response = self.act()
+
+        self.assertEqual(response['statusCode'], 503)
+
+    def test_deadline_limits_attempts(self):
+        with self.fail_stores(*[rsputil.ConditionalCheckFailedException() for _ in range(3)]):
+            response = self.act(Context(remaining_millis=0))
+
+        self.assertEqual(response['statusCode'], 409)
+        self.assertEqual(response['headers'][actionhandler.ATTEMPTS_HEADER], '1')
+
+    def test_other_errors_are_raised(self):
+        with self.fail_stores(ClientError({'Error': {'Code': 'ValidationException'}}, 'PutItem')):
+            with self.assertRaises(ClientError):
+                self.act()
+
+
+if __name__ == '__main__':
+    unittest.main()
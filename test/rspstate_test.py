@@ -0,0 +1,77 @@
+import unittest
+import sys
+
+sys.path.append(f'src/layers/rspfootball-util')
+
+import rspmodel
+from rspmodel import Play, RollResult, State
+from rspstate import GameState
+
+GAME = rspmodel.Game(
+        gameId = 'test_default_id',
+        version = 3,
+        players = {
+            'home': 'harry',
+            'away': 'daylin',
+        },
+        state = State.PLAY_CALL,
+        play = None,
+        possession = 'home',
+        ballpos = 35,
+        firstDown = 45,
+        playCount = 10,
+        down = 1,
+        firstKick = 'away',
+        score = {
+            'home': 0,
+            'away': 0
+        },
+        penalties = {
+            'home': 2,
+            'away': 2
+        },
+        rsp = {
+            'home': None,
+            'away': None
+        },
+        roll = [],
+        actions = {
+            'home': ['CALL_PLAY', 'PENALTY'],
+            'away': ['POLL', 'PENALTY']
+        },
+        result = [])
+
+class GameStateTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        state = GameState.from_game(GAME.copy(deep=True))
+        self.assertEqual(state.to_game().dict(), GAME.dict())
+
+    def test_slots(self):
+        state = GameState.from_game(GAME.copy(deep=True))
+        with self.assertRaises(AttributeError):
+            state.unknown = 1
+
+    def test_changes_are_kept(self):
+        game = GAME.copy(deep=True)
+        game.mark_clean()
+
+        state = GameState.from_game(game)
+        state.state = State.SHORT_RUN
+        state.play = Play.SHORT_RUN
+        state.actions['home'] = ['RSP']
+        state.result += [RollResult(player='home', roll=[3])]
+
+        changes = state.to_game(game).get_changes()
+        self.assertEqual(changes[('state',)], State.SHORT_RUN)
+        self.assertEqual(changes[('play',)], Play.SHORT_RUN)
+        self.assertEqual(changes[('actions', 'home')], ['RSP'])
+        self.assertNotIn(('actions', 'away'), changes)
+
+    def test_dict(self):
+        state = GameState(**GAME.dict())
+        self.assertEqual(state.dict(), GAME.dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
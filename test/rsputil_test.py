@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import time
+import unittest
+import sys
+
+sys.path.append(f'src/layers/rspfootball-util')
+sys.path.append(f'src/functions/rspfootball-new-game')
+
+import rsplog
+import rspstore
+import rsputil
+import newgame
+
+
+class GameCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = rsputil.GameCache(max_size=2, ttl=60)
+
+    def test_hit_at_cached_version(self):
+        game = newgame.new_game('game1')
+        self.cache.put(game)
+
+        cached = self.cache.get('game1', 0)
+        self.assertEqual(cached, game)
+        self.assertIsNot(cached, game)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_miss_at_other_version(self):
+        self.cache.put(newgame.new_game('game1'))
+
+        self.assertIsNone(self.cache.get('game1', 1))
+        self.assertIsNone(self.cache.get('game2', 0))
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_cached_game_is_copied(self):
+        game = newgame.new_game('game1')
+        self.cache.put(game)
+
+        game.players['home'] = 'harry'
+        self.cache.get('game1', 0).players['away'] = 'daylin'
+
+        self.assertEqual(self.cache.get('game1', 0).players, {'home': None, 'away': None})
+
+    def test_evicts_least_recently_used(self):
+        for game_id in ['game1', 'game2']:
+            self.cache.put(newgame.new_game(game_id))
+
+        self.cache.get('game1', 0)
+        self.cache.put(newgame.new_game('game3'))
+
+        self.assertIsNone(self.cache.get_version('game2'))
+        self.assertEqual(self.cache.get_version('game1'), 0)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_entries_expire(self):
+        cache = rsputil.GameCache(max_size=2, ttl=0.01)
+        cache.put(newgame.new_game('game1'))
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get('game1', 0))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_disabled_cache(self):
+        cache = rsputil.GameCache(max_size=0, ttl=60)
+        cache.put(newgame.new_game('game1'))
+        self.assertIsNone(cache.get_version('game1'))
+
+
+class CachedStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['GAME_STORE'] = 'memory'
+        rspstore.reset_store()
+        rsputil.GAME_CACHE.clear()
+
+    def tearDown(self):
+        rspstore.reset_store()
+        rsputil.GAME_CACHE.clear()
+
+    def test_store_writes_through(self):
+        game = newgame.new_game('game1')
+        rsputil.store_game(game)
+
+        self.assertEqual(rsputil.get_game('game1'), game)
+        self.assertEqual(rsputil.GAME_CACHE.stats()['hits'], 1)
+
+    def test_stale_entry_is_reread(self):
+        game = newgame.new_game('game1')
+        rsputil.store_game(game)
+
+        # a write from another container
+        game.version = 1
+        rspstore.get_store().store_game(game)
+
+        self.assertEqual(rsputil.get_game('game1').version, 1)
+        self.assertEqual(rsputil.GAME_CACHE.stats()['misses'], 1)
+        self.assertEqual(rsputil.GAME_CACHE.get_version('game1'), 1)
+
+    def test_failed_store_caches_current_game(self):
+        game = newgame.new_game('game1')
+        rsputil.store_game(game)
+
+        game.version = 6
+        with self.assertRaises(rsputil.ConditionalCheckFailedException) as context:
+            rsputil.store_game(game, expected_version=5)
+
+        self.assertEqual(context.exception.game.version, 0)
+        self.assertEqual(rsputil.GAME_CACHE.get_version('game1'), 0)
+
+    def test_failed_store_of_missing_game_invalidates(self):
+        game = newgame.new_game('game1')
+        rsputil.GAME_CACHE.put(game)
+
+        with self.assertRaises(rsputil.ConditionalCheckFailedException) as context:
+            rsputil.store_game(game, expected_version=0)
+
+        self.assertIsNone(context.exception.game)
+        self.assertIsNone(rsputil.GAME_CACHE.get_version('game1'))
+
+    def test_store_returns_body(self):
+        game = newgame.new_game('game1')
+        body = rsputil.store_game(game)
+
+        self.assertEqual(json.loads(body), json.loads(game.json()))
+        self.assertIs(rsputil.get_game_body('game1'), body)
+
+    def test_body_is_serialized_once_per_version(self):
+        game = newgame.new_game('game1')
+        rspstore.get_store().store_game(game)
+
+        body = rsputil.get_game_body('game1')
+        self.assertEqual(json.loads(body), json.loads(game.json()))
+        self.assertIs(rsputil.get_game_body('game1', 0), body)
+
+        # a write from another container
+        game.version = 1
+        rspstore.get_store().store_game(game)
+
+        new_body = rsputil.get_game_body('game1')
+        self.assertEqual(json.loads(new_body)['version'], 1)
+        self.assertIs(rsputil.get_game_body('game1', 1), new_body)
+
+    def test_missing_game_body(self):
+        self.assertIsNone(rsputil.get_game_body('game1'))
+
+
+class JsonLoggingTest(unittest.TestCase):
+
+    def test_json_record_with_fields(self):
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'handled %s', ('RSP',), None)
+        record.__dict__.update(rsplog.fields(gameId='game1', version=3))
+
+        self.assertEqual(json.loads(rsplog.JsonFormatter().format(record)), {
+            'level': 'INFO',
+            'logger': 'test',
+            'message': 'handled RSP',
+            'gameId': 'game1',
+            'version': 3,
+        })
+
+    def test_disabled_level_does_not_format(self):
+        class Unformattable:
+            def __str__(self):
+                raise AssertionError('formatted a disabled record')
+
+        logger = logging.getLogger('rsplog_test')
+        logger.setLevel(logging.INFO)
+        logger.debug('game: %s', Unformattable())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,9 @@
+import json
+
+# helpers shared by the handler tests
+
+def request(body):
+    return {'body': json.dumps(body)}
+
+def response_body(response):
+    return json.loads(response['body'])